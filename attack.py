@@ -9,236 +9,330 @@ class Attack:
     """
 
     @staticmethod
-    def random_distortion_attack(leak_trajectory, ratio):
+    def get_cells(trajectory):
+        """
+        Extracts the cells of a trajectory for the batch attacks.
+
+        Args:
+            trajectory (list): The trajectory as a list of tuples (lat, lng, tt).
+
+        Returns:
+            np.ndarray: The cells (length x 2).
+        """
+        return np.array(
+            [(lat, lng) for lat, lng, _ in trajectory], dtype=np.int64
+        ).reshape(-1, 2)
+
+    @staticmethod
+    def with_times(cells, trajectory):
+        """
+        Attaches the timestamps of a trajectory to attacked cells.
+
+        Args:
+            cells (np.ndarray): The attacked cells (length x 2).
+            trajectory (list): The trajectory providing the timestamps as tuples (lat, lng, tt).
+
+        Returns:
+            list: The attacked trajectory as a list of tuples (lat, lng, tt).
+        """
+        return [
+            (lat, lng, tt) for (lat, lng), (_, _, tt) in zip(cells.tolist(), trajectory)
+        ]
+
+    @staticmethod
+    def random_distortion_attack(leak_trajectory, ratio, rng=random):
         """
         Applies random distortion to a given leak trajectory.
 
+        This is random_distortion_attack_batch on a single trajectory.
+
         Args:
             leak_trajectory (list): The original leak trajectory represented as a list of tuples (lat, lng, tt).
             ratio (float): The probability of applying distortion to each point in the trajectory.
+            rng (RandomStream, optional): The random stream to draw from. Defaults to the global numpy stream.
 
         Returns:
             list: The distorted leak trajectory.
         """
-
-        new_trajectory = []
-        for lat, lng, tt in leak_trajectory:
-            if random.random() < ratio:
-                sampled_lat, sampled_lng = Sampling.sample_nearby_point((lat, lng), 1)
-                new_trajectory.append((sampled_lat, sampled_lng, tt))
-            else:
-                new_trajectory.append((lat, lng, tt))
-        return new_trajectory
+        new_cells = Attack.random_distortion_attack_batch(
+            Attack.get_cells(leak_trajectory)[None], ratio, rng
+        )
+        return Attack.with_times(new_cells[0], leak_trajectory)
 
     @staticmethod
-    def correlation_attack(leak_trajectory, tau, ratio, correlation, debug=False):
+    def correlation_attack(
+        leak_trajectory, tau, ratio, correlation, debug=False, rng=random
+    ):
         """
         Applies correlation-based attack to a given leak trajectory.
 
+        This is correlation_attack_batch on a single trajectory.
+
         Args:
             leak_trajectory (list): The original leak trajectory represented as a list of tuples (lat, lng, tt).
             tau (float): The correlation threshold.
             ratio (float): The probability of applying distortion to each point in the trajectory.
             correlation (Correlation): An instance of the Correlation class containing transition information.
-            replace (bool): Flag indicating whether to replace previous coordinates with distorted ones (default: True).
             debug (bool): Flag indicating whether to enable debugging output (default: False).
+            rng (RandomStream): The random stream to draw from (default: the global numpy stream).
 
         Returns:
             list: The attacked leak trajectory.
         """
-
-        new_trajectory = []
-
-        first_lat, first_lng, first_time = leak_trajectory[0]
-        new_trajectory.append((first_lat, first_lng, first_time))
-        prev_lat, prev_lng = first_lat, first_lng
-
-        for i, ((lat, lng, _), (current_lat, current_lng, current_time)) in enumerate(
-            zip(leak_trajectory, leak_trajectory[1:])
-        ):
-            candidates, tau_candidates = correlation.get_all_transition(
-                (prev_lat, prev_lng), None, tau, False
-            )
-            sampled_lat, sampled_lng = current_lat, current_lng
-
-            if (current_lat, current_lng) not in tau_candidates.keys():
-                if random.random() < ratio:
-                    if len(candidates) > 0:
-                        if len(tau_candidates) > 0:
-                            sampled_lat, sampled_lng = max(
-                                tau_candidates.keys(), key=lambda x: tau_candidates[x]
-                            )
-
-                        else:
-                            sampled_lat, sampled_lng = max(
-                                candidates.keys(), key=lambda x: candidates[x]
-                            )
-
-                        if debug:
-                            print(
-                                i,
-                                "Not in, Flip",
-                                current_lat,
-                                current_lng,
-                                "->",
-                                sampled_lat,
-                                sampled_lng,
-                            )
-
-                    else:
-                        if debug:
-                            print("No candidate, pass")
-
-            elif random.random() < ratio:
-                sampled_lat, sampled_lng = Sampling.sample_nearby_point(
-                    (current_lat, current_lng), Configuration.SCALE
+        leak_cells = Attack.get_cells(leak_trajectory)
+        new_cells = Attack.correlation_attack_batch(
+            leak_cells[None], tau, ratio, correlation, rng
+        )[0]
+        if debug:
+            print(
+                "Flipped {} of {} points.".format(
+                    (new_cells != leak_cells).any(axis=1).sum(), len(leak_cells)
                 )
-                if debug:
-                    print(
-                        i,
-                        "in, Flip",
-                        current_lat,
-                        current_lng,
-                        "->",
-                        sampled_lat,
-                        sampled_lng,
-                    )
+            )
+        return Attack.with_times(new_cells, leak_trajectory)
 
-            new_trajectory.append((sampled_lat, sampled_lng, current_time))
+    @staticmethod
+    def majority_collusion_attack(colluding_trajectories, rng=random):
+        """
+        Performs a majority collusion attack on a set of colluding trajectories.
 
-            prev_lat, prev_lng = current_lat, current_lng
+        This is majority_collusion_attack_batch on a single colluding set. The timestamps
+        are taken from the last colluding trajectory.
 
-        return new_trajectory
+        Args:
+            colluding_trajectories (list): The set of colluding trajectories represented as a list of lists of tuples (lat, lng, tt).
+            rng (RandomStream): The random stream to draw from (default: the global numpy stream).
+
+        Returns:
+            list: The attacked leak trajectory.
+        """
+        colluding_cells = np.array(
+            [Attack.get_cells(trajectory) for trajectory in colluding_trajectories]
+        )
+        leak_cells = Attack.majority_collusion_attack_batch(colluding_cells[None], rng)
+        return Attack.with_times(leak_cells[0], colluding_trajectories[-1])
 
     @staticmethod
-    def majority_collusion_attack(colluding_trajectories):
+    def probabilistic_collusion_attack(
+        colluding_trajectories,
+        p_estimate,
+        tau,
+        correlation,
+        attack_ratio,
+        debug=False,
+        rng=random,
+    ):
         """
-        Performs a majority collusion attack on a set of colluding trajectories.
+        Performs a probabilistic collusion attack on a set of colluding trajectories.
+
+        This is probabilistic_collusion_attack_batch on a single colluding set. The
+        timestamps are taken from the last colluding trajectory.
 
         Args:
             colluding_trajectories (list): The set of colluding trajectories represented as a list of lists of tuples (lat, lng, tt).
+            p_estimate (float): The probability estimate for the first coordinate in the attack.
+            tau (float): The correlation threshold.
+            correlation (Correlation): An instance of the Correlation class containing transition information.
+            attack_ratio (float): The probability of applying distortion to each point in the trajectory.
+            debug (bool): Flag indicating whether to enable debugging output (default: False).
+            rng (RandomStream): The random stream to draw from (default: the global numpy stream).
 
         Returns:
             list: The attacked leak trajectory.
         """
+        colluding_cells = np.array(
+            [Attack.get_cells(trajectory) for trajectory in colluding_trajectories]
+        )
+        leak_cells = Attack.probabilistic_collusion_attack_batch(
+            colluding_cells[None], p_estimate, tau, correlation, attack_ratio, rng
+        )[0]
+        if debug:
+            for i, (cell_lat, cell_lng) in enumerate(leak_cells.tolist()):
+                print(i, "Report:", cell_lat, cell_lng)
+        return Attack.with_times(leak_cells, colluding_trajectories[-1])
 
-        leak_trajectory = []
+    @staticmethod
+    def random_distortion_attack_batch(leak_cells, ratio, rng=random):
+        """
+        Applies random distortion to a stack of leak trajectories at once.
 
-        for i in range(len(colluding_trajectories[0])):
-            count_dict = defaultdict(lambda: 0)
+        Args:
+            leak_cells (np.ndarray): The leak trajectories as cells (S x length x 2).
+            ratio (float): The probability of applying distortion to each point in the trajectory.
+            rng (RandomStream, optional): The random stream to draw from. Defaults to the global numpy stream.
 
-            for colluding_trajectory in colluding_trajectories:
-                cell_lat, cell_lng, true_time = colluding_trajectory[i]
-                count_dict[(cell_lat, cell_lng)] += 1
+        Returns:
+            np.ndarray: The distorted leak trajectories (S x length x 2).
+        """
+        leak_cells = np.asarray(leak_cells, dtype=np.int64)
+        new_cells = leak_cells.copy()
+        distorted = rng.random(leak_cells.shape[:2]) < ratio
+        new_cells[distorted] = Sampling.sample_nearby_points(
+            leak_cells[distorted], 1, rng
+        )
+        return new_cells
 
-            max_ct = max(count_dict.values())
-            max_candidates = []
+    @staticmethod
+    def correlation_attack_batch(leak_cells, tau, ratio, correlation, rng=random):
+        """
+        Applies correlation-based attack to a stack of leak trajectories at once.
 
-            for key, ct in count_dict.items():
-                if max_ct == ct:
-                    max_candidates.append(key)
+        Every point depends only on the previous leaked point, so all points of all
+        trajectories are decided together.
 
-            max_key = max_candidates[random.choice(range(len(max_candidates)))]
-            leak_trajectory.append((max_key[0], max_key[1], true_time))
+        Args:
+            leak_cells (np.ndarray): The leak trajectories as cells (S x length x 2).
+            tau (float): The correlation threshold.
+            ratio (float): The probability of applying distortion to each point in the trajectory.
+            correlation (Correlation): An instance of the Correlation class containing transition information.
+            rng (RandomStream, optional): The random stream to draw from. Defaults to the global numpy stream.
 
-        return leak_trajectory
+        Returns:
+            np.ndarray: The attacked leak trajectories (S x length x 2).
+        """
+        leak_cells = np.asarray(leak_cells, dtype=np.int64)
+        new_cells = leak_cells.copy()
+        prev_cells = leak_cells[:, :-1].reshape(-1, 2)
+        current_cells = leak_cells[:, 1:].reshape(-1, 2)
 
-    def probabilistic_collusion_attack(
-        colluding_trajectories, p_estimate, tau, correlation, attack_ratio, debug=False
+        cells, probs, valid = Sampling.get_padded_candidates(
+            prev_cells, tau, correlation, tier=0
+        )
+        tau_valid = valid & (probs >= tau)
+        in_tau = (tau_valid & (cells == current_cells[:, None]).all(axis=2)).any(axis=1)
+        flipped = rng.random(len(current_cells)) < ratio
+
+        # Not a likely transition: report the most likely one instead
+        best = np.where(
+            tau_valid.any(axis=1),
+            np.argmax(np.where(tau_valid, probs, -1), axis=1),
+            np.argmax(np.where(valid, probs, -1), axis=1),
+        )
+        replaced = ~in_tau & flipped & valid.any(axis=1)
+        sampled = current_cells.copy()
+        sampled[replaced] = cells[replaced, best[replaced]]
+
+        # A likely transition: move it to a nearby cell
+        distorted = in_tau & flipped
+        sampled[distorted] = Sampling.sample_nearby_points(
+            current_cells[distorted], Configuration.SCALE, rng
+        )
+
+        new_cells[:, 1:] = sampled.reshape(leak_cells[:, 1:].shape)
+        return new_cells
+
+    @staticmethod
+    def get_collusion_counts(colluding_cells):
+        """
+        Counts the colluders agreeing with each colluder at every position.
+
+        Args:
+            colluding_cells (np.ndarray): The colluding trajectories as cells (S x C x length x 2).
+
+        Returns:
+            tuple: The counts (S x C x length) and the mask of first occurrences (S x C x length),
+                which lists every distinct cell once in the order of the colluders.
+        """
+        same = (colluding_cells[:, :, None] == colluding_cells[:, None]).all(axis=4)
+        counts = same.sum(axis=2)
+        earlier = np.tril(np.ones(same.shape[1:3], dtype=bool), k=-1)
+        first = ~(same & earlier[None, :, :, None]).any(axis=2)
+        return counts, first
+
+    @staticmethod
+    def majority_collusion_attack_batch(colluding_cells, rng=random):
+        """
+        Performs majority collusion attacks on a stack of colluding sets at once.
+
+        Args:
+            colluding_cells (np.ndarray): The colluding trajectories as cells (S x C x length x 2).
+            rng (RandomStream, optional): The random stream to draw from. Defaults to the global numpy stream.
+
+        Returns:
+            np.ndarray: The attacked leak trajectories (S x length x 2).
+        """
+        colluding_cells = np.asarray(colluding_cells, dtype=np.int64)
+        counts, first = Attack.get_collusion_counts(colluding_cells)
+
+        # Pick one of the distinct cells with the maximum count uniformly
+        candidates = first & (counts == counts.max(axis=1, keepdims=True))
+        ranks = np.cumsum(candidates, axis=1) - 1
+        picks = (rng.random(candidates[:, 0].shape) * candidates.sum(axis=1)).astype(
+            np.int64
+        )
+        chosen = candidates & (ranks == picks[:, None])
+        return np.take_along_axis(
+            colluding_cells, np.argmax(chosen, axis=1)[:, None, :, None], axis=1
+        )[:, 0]
+
+    @staticmethod
+    def probabilistic_collusion_attack_batch(
+        colluding_cells, p_estimate, tau, correlation, attack_ratio, rng=random
     ):
         """
-        Performs a probabilistic collusion attack on a set of colluding trajectories.
+        Performs probabilistic collusion attacks on a stack of colluding sets at once.
+
+        The positions are processed in order since each depends on the previous report,
+        but all sets advance together.
 
         Args:
-            colluding_trajectories (list): The set of colluding trajectories represented as a list of lists of tuples (lat, lng, tt).
+            colluding_cells (np.ndarray): The colluding trajectories as cells (S x C x length x 2).
             p_estimate (float): The probability estimate for the first coordinate in the attack.
             tau (float): The correlation threshold.
             correlation (Correlation): An instance of the Correlation class containing transition information.
             attack_ratio (float): The probability of applying distortion to each point in the trajectory.
-            debug (bool): Flag indicating whether to enable debugging output (default: False).
+            rng (RandomStream, optional): The random stream to draw from. Defaults to the global numpy stream.
 
         Returns:
-            list: The attacked leak trajectory.
+            np.ndarray: The attacked leak trajectories (S x length x 2).
         """
+        colluding_cells = np.asarray(colluding_cells, dtype=np.int64)
+        set_count, leaked_count, length = colluding_cells.shape[:3]
+        counts, first = Attack.get_collusion_counts(colluding_cells)
+        likelihoods = (1 - p_estimate) ** counts * p_estimate ** (leaked_count - counts)
+        sets = np.arange(set_count)
+
+        def sample_proportionally(weights, support):
+            # Sampling.sample_proportionally_with_truth without truth, per row
+            return Sampling.draw_with_truth(
+                weights,
+                support,
+                np.full(len(weights), -1),
+                np.zeros(len(weights)),
+                rng.random(len(weights)),
+            )
 
-        leaked_count = len(colluding_trajectories)
-        leak_trajectory = []
+        leak_cells = np.empty((set_count, length, 2), dtype=np.int64)
 
         # Process the first entry
-        count_dict = defaultdict(lambda: 0)
-        for colluding_trajectory in colluding_trajectories:
-            cell_lat, cell_lng, true_time = colluding_trajectory[0]
-            count_dict[(cell_lat, cell_lng)] += 1
-
-        for key, count in count_dict.items():
-            count_dict[key] = (1 - p_estimate) ** count * p_estimate ** (
-                leaked_count - count
+        picks = sample_proportionally(likelihoods[:, :, 0], first[:, :, 0])
+        leak_cells[:, 0] = colluding_cells[sets, picks, 0]
+
+        # Process the rest
+        for i in range(1, length):
+            current = colluding_cells[:, :, i]
+            rolled = rng.random(set_count) < attack_ratio
+
+            cells, probs, valid = Sampling.get_padded_candidates(
+                leak_cells[:, i - 1], tau, correlation, tier=0
             )
+            matches = valid[:, None] & (cells[:, None] == current[:, :, None]).all(
+                axis=3
+            )
+            tran_probs = np.where(matches, probs[:, None], 0).max(axis=2)
+            support = first[:, :, i] & (tran_probs > tau)
 
-        (cell_lat, cell_lng), _ = Sampling.sample_proportionally_with_truth(
-            count_dict, None, None
-        )
-        leak_trajectory.append((cell_lat, cell_lng, true_time))
+            # Sample among truths
+            picks = sample_proportionally(tran_probs * likelihoods[:, :, i], support)
+            reported = current[sets, picks]
 
-        # Process the rest
-        for i in range(len(colluding_trajectories[0])):
-            if i == 0:
-                continue
-
-            if debug:
-                print(i, leak_trajectory[-1])
-
-            prev_lat, prev_lng, prev_time = leak_trajectory[-1]
-            count_dict = defaultdict(lambda: 0)
-            for colluding_trajectory in colluding_trajectories:
-                cell_lat, cell_lng, time = colluding_trajectory[i]
-                count_dict[(cell_lat, cell_lng)] += 1
-            if debug:
-                print("Count:", count_dict)
-
-            if random.random() < attack_ratio:
-                roll_dict = {}
-                for key, count in count_dict.items():
-                    transition = correlation.get_transition((prev_lat, prev_lng))
-                    if key in transition.keys() and transition[key] > tau:
-                        tran_prob = transition[key]
-                    else:
-                        tran_prob = 0
-
-                    if tran_prob > 0:
-                        roll_dict[key] = (
-                            tran_prob
-                            * (1 - p_estimate) ** count
-                            * p_estimate ** (leaked_count - count)
-                        )
-
-                if debug:
-                    print(roll_dict)
-
-                if len(roll_dict) > 0:
-                    if debug:
-                        print("Sample among truths")
-                    (cell_lat, cell_lng), _ = Sampling.sample_proportionally_with_truth(
-                        roll_dict, None, None
-                    )
-
-                else:
-                    if debug:
-                        print("Pick MAX Prob")
-                    transition = correlation.get_transition((prev_lat, prev_lng))
-                    cell_lat, cell_lng = sorted(
-                        transition.keys(), key=lambda x: -transition[x]
-                    )[0]
-
-            else:
-                if debug:
-                    print("Pick as MJR")
-                cell_lat, cell_lng = sorted(
-                    count_dict.keys(), key=lambda x: -count_dict[x]
-                )[0]
-
-            if debug:
-                print("Report:", cell_lat, cell_lng)
-            leak_trajectory.append((cell_lat, cell_lng, true_time))
-
-        return leak_trajectory
+            # Pick MAX prob
+            best = cells[sets, np.argmax(np.where(valid, probs, -1), axis=1)]
+            reported = np.where(support.any(axis=1)[:, None], reported, best)
+
+            # Pick as MJR
+            majority = current[sets, np.argmax(counts[:, :, i], axis=1)]
+
+            leak_cells[:, i] = np.where(rolled[:, None], reported, majority)
+
+        return leak_cells
@@ -52,3 +52,6 @@ class Configuration:
 
     EVAL_GRID_SIZE = 10
     # Grid size for utility evaluation.
+
+    CANDIDATE_CACHE_SIZE = 65536
+    # Number of candidate and emission sets kept per correlation model.
@@ -67,6 +67,111 @@ class Coordinates:
         y_id = int((point[1] - Configuration.GPS_LIMIT["lng"][0]) / y_step)
         return x_id, y_id
 
+    @staticmethod
+    def get_cells(points, grid_size=None):
+        """
+        Converts an array of geographical points to their grid cells in one pass.
+
+        Args:
+            points (np.ndarray): The geographical points as an (n, 2) array of (latitude, longitude).
+            grid_size (int): The size of the grid (optional).
+
+        Returns:
+            np.ndarray: The grid cells as an (n, 2) integer array, matching Coordinates.get_cell.
+        """
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        lat_limit, lng_limit = (
+            Configuration.GPS_LIMIT["lat"],
+            Configuration.GPS_LIMIT["lng"],
+        )
+        in_range = (
+            (lat_limit[0] <= points[:, 0])
+            & (points[:, 0] < lat_limit[1])
+            & (lng_limit[0] <= points[:, 1])
+            & (points[:, 1] < lng_limit[1])
+        )
+        assert in_range.all(), points[np.argmin(in_range)]
+
+        if not grid_size:
+            grid_size = Configuration.GRID_SIZE
+        x_step = (lat_limit[1] - lat_limit[0]) / grid_size
+        y_step = (lng_limit[1] - lng_limit[0]) / grid_size
+        cells = np.empty(points.shape, dtype=np.int64)
+        cells[:, 0] = (points[:, 0] - lat_limit[0]) / x_step
+        cells[:, 1] = (points[:, 1] - lng_limit[0]) / y_step
+        return cells
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def get_cell_mesh(grid_size):
+        """
+        Builds the coordinate mesh of all grid cells, indexed by cell id.
+
+        Args:
+            grid_size (int): The size of the grid.
+
+        Returns:
+            tuple: The x and y coordinates of every cell as two read-only (grid_size ** 2,) arrays.
+        """
+        mesh_x, mesh_y = np.divmod(np.arange(grid_size**2), grid_size)
+        mesh_x, mesh_y = mesh_x.astype(np.float64), mesh_y.astype(np.float64)
+        mesh_x.flags.writeable = False
+        mesh_y.flags.writeable = False
+        return mesh_x, mesh_y
+
+    @staticmethod
+    def get_cell_id(cell):
+        """
+        Flattens a grid cell into its row-major cell id.
+
+        Args:
+            cell (tuple): The grid cell represented as a tuple (x, y).
+
+        Returns:
+            int: The cell id, i.e., x * GRID_SIZE + y.
+        """
+        return int(cell[0]) * Configuration.GRID_SIZE + int(cell[1])
+
+    @staticmethod
+    def get_cell_keys(cells):
+        """
+        Encodes arrays of cells as one integer each, so that grouping them is a 1-D sort.
+
+        Unlike get_cell_id, the key does not depend on GRID_SIZE, so cells outside the grid
+        keep distinct keys as long as their coordinates stay within +-2 ** 31.
+
+        Args:
+            cells (np.ndarray): The cells, with the (x, y) pairs on the last axis.
+
+        Returns:
+            np.ndarray: The keys, with the shape of cells without its last axis.
+        """
+        cells = np.asarray(cells, dtype=np.int64)
+        return cells[..., 0] * (1 << 32) + cells[..., 1]
+
+    @staticmethod
+    def get_neighbor_cells(cell):
+        """
+        Lists the in-range cells within NEIGHBOR_RANGE of a given grid cell.
+
+        Args:
+            cell (tuple): The grid cell represented as a tuple (x, y).
+
+        Returns:
+            list: The neighboring cells (including the cell itself) in row-major order.
+        """
+        x, y = cell[0], cell[1]
+        neighbor_cells = []
+        for x_cell in range(
+            x - Configuration.NEIGHBOR_RANGE, x + Configuration.NEIGHBOR_RANGE + 1
+        ):
+            for y_cell in range(
+                y - Configuration.NEIGHBOR_RANGE, y + Configuration.NEIGHBOR_RANGE + 1
+            ):
+                if Coordinates.in_range_cell((x_cell, y_cell)):
+                    neighbor_cells.append((x_cell, y_cell))
+        return neighbor_cells
+
     @staticmethod
     def get_cell_distance(point1, point2):
         """
@@ -16,21 +16,82 @@ class Correlation:
         Args:
             prior_knowledge (list): Prior knowledge of cell trajectories.
         """
+        (
+            emission_ids,
+            emission_counts,
+            prev_ids,
+            curr_ids,
+            transition_counts,
+        ) = Correlation.generate_correlation_model(prior_knowledge)
 
-        def generate_correlation_model(prior):
-            emission = defaultdict(lambda: 0)
-            transition = defaultdict(lambda: defaultdict(lambda: 0))
+        self.emission = defaultdict(lambda: 0)
+        for cell_id, count in zip(emission_ids.tolist(), emission_counts.tolist()):
+            self.emission[divmod(cell_id, Configuration.GRID_SIZE)] = count
 
-            for cell_trajectory in prior:
-                for prev_point, curr_point in zip(cell_trajectory, cell_trajectory[1:]):
-                    transition[Coordinates.get_cell(prev_point)][
-                        Coordinates.get_cell(curr_point)
-                    ] += 1
-                    emission[Coordinates.get_cell(curr_point)] += 1
+        self.transition = defaultdict(lambda: defaultdict(lambda: 0))
+        for prev_id, curr_id, count in zip(
+            prev_ids.tolist(), curr_ids.tolist(), transition_counts.tolist()
+        ):
+            self.transition[divmod(prev_id, Configuration.GRID_SIZE)][
+                divmod(curr_id, Configuration.GRID_SIZE)
+            ] = count
+
+    @staticmethod
+    def generate_correlation_model(prior):
+        """
+        Counts emissions and transitions of the prior trajectories on flattened cell ids.
 
-            return emission, transition
+        All points are converted to cells in one NumPy pass. Counts are returned in the order
+        in which each cell (pair) is first observed, so dicts rebuilt from them match the
+        point-by-point construction exactly.
+
+        Args:
+            prior (list): Prior knowledge of point trajectories.
 
-        self.emission, self.transition = generate_correlation_model(prior_knowledge)
+        Returns:
+            tuple: (emission_ids, emission_counts, prev_ids, curr_ids, transition_counts) arrays.
+        """
+        start_time = time.perf_counter()
+        size = Configuration.GRID_SIZE**2
+
+        trajectories = [
+            np.asarray(trajectory, dtype=np.float64)[:, :2]
+            for trajectory in prior
+            if len(trajectory) > 0
+        ]
+        if trajectories:
+            points = np.concatenate(trajectories)
+        else:
+            points = np.empty((0, 2))
+        cells = Coordinates.get_cells(points)
+        cell_ids = cells[:, 0] * Configuration.GRID_SIZE + cells[:, 1]
+
+        is_curr = np.ones(len(points), dtype=bool)
+        is_curr[np.cumsum([0] + [len(t) for t in trajectories])[:-1]] = False
+        curr_index = np.flatnonzero(is_curr)
+        curr_ids = cell_ids[curr_index]
+        pair_ids = cell_ids[curr_index - 1] * size + curr_ids
+
+        emission_ids, emission_first, emission_counts = np.unique(
+            curr_ids, return_index=True, return_counts=True
+        )
+        order = np.argsort(emission_first, kind="stable")
+        emission_ids, emission_counts = emission_ids[order], emission_counts[order]
+
+        pair_ids, pair_first, transition_counts = np.unique(
+            pair_ids, return_index=True, return_counts=True
+        )
+        order = np.argsort(pair_first, kind="stable")
+        prev_ids, curr_ids = np.divmod(pair_ids[order], size)
+        transition_counts = transition_counts[order]
+
+        elapsed = time.perf_counter() - start_time
+        print(
+            "Correlation model built from {} points in {:.2f}s ({:.0f} points/s).".format(
+                len(points), elapsed, len(points) / max(elapsed, 1e-9)
+            )
+        )
+        return emission_ids, emission_counts, prev_ids, curr_ids, transition_counts
 
     def get_transition(self, prior):
         """
@@ -42,28 +103,16 @@ class Correlation:
         Returns:
             dict: The transition probabilities to neighboring cells.
         """
-        local_transition = {}
         x, y = prior[0], prior[1]
+        counts = self.transition.get((x, y), {})
 
-        total_transition = sum(self.transition[(x, y)].values())
+        total_transition = sum(counts.values())
 
         if total_transition <= 0:
-            for x_cell in range(
-                x - Configuration.NEIGHBOR_RANGE, x + Configuration.NEIGHBOR_RANGE + 1
-            ):
-                for y_cell in range(
-                    y - Configuration.NEIGHBOR_RANGE,
-                    y + Configuration.NEIGHBOR_RANGE + 1,
-                ):
-                    if Coordinates.in_range_cell((x_cell, y_cell)):
-                        local_transition[(x_cell, y_cell)] = 1
-
-            return {key: 1 / len(local_transition) for key in local_transition.keys()}
+            local_transition = Coordinates.get_neighbor_cells((x, y))
+            return {key: 1 / len(local_transition) for key in local_transition}
         else:
-            return {
-                key: value / total_transition
-                for key, value in self.transition[(x, y)].items()
-            }
+            return {key: value / total_transition for key, value in counts.items()}
 
     def get_vanilla_transition(self, prior):
         """
@@ -76,7 +125,7 @@ class Correlation:
             dict: The original transition probabilities to neighboring cells.
         """
         x, y = prior[0], prior[1]
-        return self.transition[(x, y)]
+        return self.transition.get((x, y), {})
 
     def get_emission(self, prior):
         """
@@ -98,7 +147,9 @@ class Correlation:
                 y - Configuration.NEIGHBOR_RANGE, y + Configuration.NEIGHBOR_RANGE + 1
             ):
                 if Coordinates.in_range_cell((x_cell, y_cell)):
-                    local_emission[(x_cell, y_cell)] = self.emission[(x_cell, y_cell)]
+                    local_emission[(x_cell, y_cell)] = self.emission.get(
+                        (x_cell, y_cell), 0
+                    )
 
         total_emission = sum(local_emission.values())
 
@@ -122,17 +173,716 @@ class Correlation:
         Returns:
             tuple: The transition dictionaries (candidates, tau_candidates, tau_dist_candidates).
         """
-        candidates = self.get_transition(prev_point)
-        tau_candidates = dict(filter(lambda x: x[1] >= tau, candidates.items()))
+        tiers = self.get_candidate_arrays(
+            prev_point, true_point if consider_distance else None, tau
+        )
+        return tuple(
+            dict(zip(map(tuple, cells.tolist()), probs.tolist()))
+            for cells, probs in tiers
+        )
+
+    def get_candidate_arrays(self, prev_point, true_point, tau):
+        """
+        Computes the candidate tiers of get_all_transition as read-only arrays.
+
+        The candidate and tau tiers of (prev, tau) are served from the module-level
+        candidate_cache; the distance tier is filtered from them on each call.
+
+        Args:
+            prev_point (tuple): The previous point as a tuple (x, y).
+            true_point (tuple): The true point as a tuple (x, y), or None to skip the distance tier.
+            tau (float): The correlation threshold.
+
+        Returns:
+            tuple: The (cells, probs) arrays of the candidates, the tau candidates and, with a
+                true point, the tau distance candidates.
+        """
+        tiers = candidate_cache.get_tiers(self, prev_point, tau)
+        if true_point is None:
+            return tiers
+
+        tau_cells, tau_probs = tiers[1]
+        dist = Distance.sq_euclidean(prev_point, true_point)
+        mask = ((tau_cells - np.asarray(true_point)) ** 2).sum(axis=1) <= dist
+        dist_cells, dist_probs = tau_cells[mask], tau_probs[mask]
+        dist_cells.flags.writeable = False
+        dist_probs.flags.writeable = False
+        return tiers + ((dist_cells, dist_probs),)
+
+    def build_candidate_tiers(self, prev_point, tau):
+        """
+        Builds the candidate and tau tiers of the previous point.
+
+        Args:
+            prev_point (tuple): The previous point as a tuple (x, y).
+            tau (float): The correlation threshold.
+
+        Returns:
+            tuple: The read-only (cells, probs) arrays of the candidates and the tau candidates.
+        """
+        if hasattr(self, "get_transition_row"):
+            cells, probs = self.get_transition_row(prev_point)
+            cells = np.asarray(cells, dtype=np.int64)
+        else:
+            candidates = self.get_transition(prev_point)
+            cells = np.array(list(candidates.keys()), dtype=np.int64).reshape(-1, 2)
+            probs = np.array(list(candidates.values()), dtype=np.float64)
+
+        tiers = []
+        for mask in (np.ones(len(probs), dtype=bool), probs >= tau):
+            tier_cells, tier_probs = cells[mask], probs[mask]
+            tier_cells.flags.writeable = False
+            tier_probs.flags.writeable = False
+            tiers.append((tier_cells, tier_probs))
+        return tuple(tiers)
+
+    def get_candidate_cache_info(self):
+        """
+        Reports the usage of the candidate cache.
+
+        Returns:
+            dict: The hits, misses and size of this model's entries and the capacity of the cache.
+        """
+        return candidate_cache.get_info(self)
+
+    def freeze(self):
+        """
+        Makes the model read-only so that one instance can be shared across threads.
+
+        The count defaultdicts are replaced by plain dicts without the empty rows left by
+        earlier lookups. Lookups never insert entries, so the memory footprint stays constant.
+
+        Returns:
+            Correlation: This model.
+        """
+        self.emission = dict(self.emission)
+        self.transition = {
+            cell: dict(local_transition)
+            for cell, local_transition in self.transition.items()
+            if local_transition
+        }
+        return self
+
+    def to_sparse(self):
+        """
+        Converts the model into a CSR-backed SparseCorrelation.
+
+        The conversion is kept in the candidate cache of the model, so repeated calls, e.g.
+        one per PIM trajectory, return the same SparseCorrelation.
+
+        Returns:
+            SparseCorrelation: The array-backed model with the same counts.
+        """
+        return candidate_cache.get(
+            self, ("sparse", Configuration.GRID_SIZE), self.build_sparse
+        )
+
+    def build_sparse(self):
+        """
+        Builds the CSR-backed SparseCorrelation of the model.
+
+        Returns:
+            SparseCorrelation: The array-backed model with the same counts.
+        """
+        size = Configuration.GRID_SIZE**2
+        rows, cols, counts = [], [], []
+        for prev_cell, local_transition in self.transition.items():
+            for curr_cell, count in local_transition.items():
+                rows.append(Coordinates.get_cell_id(prev_cell))
+                cols.append(Coordinates.get_cell_id(curr_cell))
+                counts.append(count)
+        transition_counts = sparse.csr_matrix(
+            (counts, (rows, cols)), shape=(size, size), dtype=np.int64
+        )
+
+        emission_counts = np.zeros(size, dtype=np.int64)
+        for cell, count in self.emission.items():
+            emission_counts[Coordinates.get_cell_id(cell)] = count
+
+        return SparseCorrelation(transition_counts, emission_counts)
+
+    def save(self, path, dataset):
+        """
+        Saves the model as memory-mappable arrays plus a small header.
+
+        Args:
+            path (str): The directory to write the model to.
+            dataset (Enum): The dataset the model was built for.
+        """
+        self.to_sparse().save(path, dataset)
+
+    @staticmethod
+    def load(path, dataset):
+        """
+        Loads a saved model with its arrays memory-mapped read-only.
+
+        Args:
+            path (str): The directory the model was saved to.
+            dataset (Enum): The dataset the model is expected to match.
+
+        Returns:
+            SparseCorrelation: The loaded model.
+        """
+        return SparseCorrelation.load(path, dataset)
+
+
+class SparseCorrelation(Correlation):
+    """
+    A CSR-backed correlation model with the same lookup API as Correlation.
+
+    Transition rows are normalized once at construction and cells without observed
+    transitions get their uniform-neighbor row precomputed, so a transition lookup is
+    an O(1) slice of the underlying arrays.
+    """
+
+    MODEL_VERSION = 1
+    # Version of the on-disk model layout written by save().
+
+    def __init__(self, transition_counts, emission_counts):
+        """
+        Initializes the SparseCorrelation class with count arrays indexed by cell id.
+
+        Args:
+            transition_counts (scipy.sparse.csr_matrix): Transition counts of shape (GRID_SIZE ** 2, GRID_SIZE ** 2).
+            emission_counts (np.ndarray): Emission counts of shape (GRID_SIZE ** 2,).
+        """
+        self.grid_size = Configuration.GRID_SIZE
+        self.transition_counts = sparse.csr_matrix(transition_counts, dtype=np.int64)
+        self.transition_counts.sort_indices()
+        self.emission_counts = np.asarray(emission_counts, dtype=np.int64)
+
+        self.transition_matrix = SparseCorrelation.normalize_transition(
+            self.transition_counts
+        )
+        self.transition_cells = np.stack(
+            np.divmod(self.transition_matrix.indices, self.grid_size), axis=1
+        )
+        (
+            self.emission_indptr,
+            self.emission_cells,
+            self.emission_probs,
+        ) = SparseCorrelation.build_emission_table(self.emission_counts)
+
+    @staticmethod
+    def from_prior(prior_knowledge):
+        """
+        Builds a SparseCorrelation directly from prior knowledge, without intermediate dicts.
+
+        Args:
+            prior_knowledge (list): Prior knowledge of point trajectories.
+
+        Returns:
+            SparseCorrelation: The generated model.
+        """
+        size = Configuration.GRID_SIZE**2
+        (
+            emission_ids,
+            emission_counts,
+            prev_ids,
+            curr_ids,
+            transition_counts,
+        ) = Correlation.generate_correlation_model(prior_knowledge)
+
+        emission = np.zeros(size, dtype=np.int64)
+        emission[emission_ids] = emission_counts
+        transition = sparse.csr_matrix(
+            (transition_counts, (prev_ids, curr_ids)),
+            shape=(size, size),
+            dtype=np.int64,
+        )
+        return SparseCorrelation(transition, emission)
+
+    @staticmethod
+    def normalize_transition(transition_counts):
+        """
+        Row-normalizes transition counts, filling empty rows with the uniform-neighbor fallback.
+
+        Args:
+            transition_counts (scipy.sparse.csr_matrix): Transition counts between cell ids.
+
+        Returns:
+            scipy.sparse.csr_matrix: The row-stochastic transition matrix.
+        """
+        size = transition_counts.shape[0]
+        grid_size = Configuration.GRID_SIZE
+        row_lengths = np.diff(transition_counts.indptr)
+        row_sums = np.asarray(transition_counts.sum(axis=1)).ravel()
 
-        if consider_distance:
-            dist = Distance.sq_euclidean(prev_point, true_point)
-            tau_dist_candidates = dict(
-                filter(
-                    lambda x: Distance.sq_euclidean(x[0], true_point) <= dist,
-                    tau_candidates.items(),
+        rows = [np.repeat(np.arange(size), row_lengths)]
+        cols = [transition_counts.indices]
+        probs = [transition_counts.data / np.repeat(row_sums, row_lengths)]
+
+        empty_ids = np.flatnonzero(row_sums <= 0)
+        empty_x, empty_y = np.divmod(empty_ids, grid_size)
+        neighbor_count = np.zeros(len(empty_ids), dtype=np.int64)
+        neighbor_rows, neighbor_cols = [], []
+        for dx in range(
+            -Configuration.NEIGHBOR_RANGE, Configuration.NEIGHBOR_RANGE + 1
+        ):
+            for dy in range(
+                -Configuration.NEIGHBOR_RANGE, Configuration.NEIGHBOR_RANGE + 1
+            ):
+                valid = (
+                    (0 <= empty_x + dx)
+                    & (empty_x + dx < grid_size)
+                    & (0 <= empty_y + dy)
+                    & (empty_y + dy < grid_size)
+                )
+                neighbor_count += valid
+                neighbor_rows.append(np.flatnonzero(valid))
+                neighbor_cols.append(
+                    (empty_x[valid] + dx) * grid_size + empty_y[valid] + dy
                 )
+        neighbor_rows = np.concatenate(neighbor_rows)
+        rows.append(empty_ids[neighbor_rows])
+        cols.append(np.concatenate(neighbor_cols))
+        probs.append(1 / neighbor_count[neighbor_rows])
+
+        transition_matrix = sparse.csr_matrix(
+            (np.concatenate(probs), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(size, size),
+        )
+        transition_matrix.sort_indices()
+        return transition_matrix
+
+    @staticmethod
+    def build_emission_table(emission_counts):
+        """
+        Precomputes the emission neighborhood distribution of every cell.
+
+        The neighborhood totals come from a box convolution of the emission count grid, so
+        each row matches Correlation.get_emission, including the uniform fallback.
+
+        Args:
+            emission_counts (np.ndarray): Emission counts of shape (GRID_SIZE ** 2,).
+
+        Returns:
+            tuple: (indptr, cells, probs) arrays of the per-cell neighborhoods in CSR layout.
+        """
+        grid_size = Configuration.GRID_SIZE
+        window = 2 * Configuration.NEIGHBOR_RANGE + 1
+        emission_grid = emission_counts.reshape(grid_size, grid_size)
+        totals = convolve2d(
+            emission_grid, np.ones((window, window), dtype=np.int64), mode="same"
+        ).ravel()
+
+        cell_x, cell_y = np.divmod(np.arange(grid_size**2), grid_size)
+        offsets = [
+            (dx, dy)
+            for dx in range(
+                -Configuration.NEIGHBOR_RANGE, Configuration.NEIGHBOR_RANGE + 1
             )
-            return candidates, tau_candidates, tau_dist_candidates
-        else:
-            return candidates, tau_candidates
+            for dy in range(
+                -Configuration.NEIGHBOR_RANGE, Configuration.NEIGHBOR_RANGE + 1
+            )
+        ]
+        neighbor_x = cell_x[:, None] + np.array([dx for dx, _ in offsets])
+        neighbor_y = cell_y[:, None] + np.array([dy for _, dy in offsets])
+        valid = (
+            (0 <= neighbor_x)
+            & (neighbor_x < grid_size)
+            & (0 <= neighbor_y)
+            & (neighbor_y < grid_size)
+        )
+        neighbor_count = valid.sum(axis=1)
+
+        rows = np.nonzero(valid)[0]
+        cells = np.stack((neighbor_x[valid], neighbor_y[valid]), axis=1)
+        probs = np.where(
+            totals[rows] > 0,
+            emission_counts[cells[:, 0] * grid_size + cells[:, 1]]
+            / np.maximum(totals[rows], 1),
+            1 / neighbor_count[rows],
+        )
+        indptr = np.concatenate(([0], np.cumsum(neighbor_count)))
+        return indptr, cells, probs
+
+    def get_emission_row(self, prior):
+        """
+        Retrieves the precomputed emission neighborhood of the prior cell without building a dict.
+
+        Args:
+            prior (tuple): The prior cell as a tuple (x, y).
+
+        Returns:
+            tuple: The neighboring cells as an (n, 2) array and their probabilities as an (n,) array.
+        """
+        if not Coordinates.in_range_cell(prior):
+            local_emission = Coordinates.get_neighbor_cells(prior)
+            cells = np.array(local_emission, dtype=np.int64).reshape(-1, 2)
+            counts = self.emission_counts[cells[:, 0] * self.grid_size + cells[:, 1]]
+            if counts.sum() <= 0:
+                return cells, np.full(len(cells), 1 / max(len(cells), 1))
+            return cells, counts / counts.sum()
+        cell_id = Coordinates.get_cell_id(prior)
+        start, end = self.emission_indptr[cell_id : cell_id + 2]
+        return self.emission_cells[start:end], self.emission_probs[start:end]
+
+    def get_transition_row(self, prior):
+        """
+        Retrieves the normalized transition row of the prior cell without building a dict.
+
+        Args:
+            prior (tuple): The prior cell as a tuple (x, y).
+
+        Returns:
+            tuple: The candidate cells as an (n, 2) array and their probabilities as an (n,) array.
+        """
+        if not Coordinates.in_range_cell(prior):
+            local_transition = Coordinates.get_neighbor_cells(prior)
+            return (
+                np.array(local_transition, dtype=np.int64).reshape(-1, 2),
+                np.full(len(local_transition), 1 / max(len(local_transition), 1)),
+            )
+        cell_id = Coordinates.get_cell_id(prior)
+        start, end = self.transition_matrix.indptr[cell_id : cell_id + 2]
+        return (
+            self.transition_cells[start:end],
+            self.transition_matrix.data[start:end],
+        )
+
+    def get_transition(self, prior):
+        """
+        Computes the transition probabilities from the prior cell.
+
+        Args:
+            prior (tuple): The prior cell as a tuple (x, y).
+
+        Returns:
+            dict: The transition probabilities to neighboring cells.
+        """
+        cells, probs = self.get_transition_row(prior)
+        return dict(zip(map(tuple, cells.tolist()), probs.tolist()))
+
+    def get_vanilla_transition(self, prior):
+        """
+        Retrieves the original (non-normalized) transition counts from the prior cell.
+
+        Args:
+            prior (tuple): The prior cell as a tuple (x, y).
+
+        Returns:
+            dict: The original transition counts to neighboring cells.
+        """
+        if not Coordinates.in_range_cell(prior):
+            return {}
+        cell_id = Coordinates.get_cell_id(prior)
+        start, end = self.transition_counts.indptr[cell_id : cell_id + 2]
+        cells = np.divmod(self.transition_counts.indices[start:end], self.grid_size)
+        return dict(
+            zip(
+                zip(cells[0].tolist(), cells[1].tolist()),
+                self.transition_counts.data[start:end].tolist(),
+            )
+        )
+
+    def get_emission(self, prior):
+        """
+        Computes the emission probabilities from the prior cell.
+
+        Args:
+            prior (tuple): The prior cell as a tuple (x, y).
+
+        Returns:
+            dict: The emission probabilities to neighboring cells.
+        """
+        cells, probs = self.get_emission_row(prior)
+        return dict(zip(map(tuple, cells.tolist()), probs.tolist()))
+
+    def freeze(self):
+        """
+        Marks the model arrays read-only. SparseCorrelation lookups never mutate the model.
+
+        Returns:
+            SparseCorrelation: This model.
+        """
+        for array in (
+            self.transition_counts.indptr,
+            self.transition_counts.indices,
+            self.transition_counts.data,
+            self.transition_matrix.indptr,
+            self.transition_matrix.indices,
+            self.transition_matrix.data,
+            self.transition_cells,
+            self.emission_counts,
+            self.emission_indptr,
+            self.emission_cells,
+            self.emission_probs,
+        ):
+            if array.flags.writeable:
+                array.flags.writeable = False
+        return self
+
+    def get_transition_matrix(self):
+        """
+        Retrieves the row-stochastic transition matrix between cell ids.
+
+        Returns:
+            scipy.sparse.csr_matrix: The transition matrix of shape (GRID_SIZE ** 2, GRID_SIZE ** 2).
+        """
+        return self.transition_matrix
+
+    def to_sparse(self):
+        """
+        Returns the model itself, which is already CSR-backed.
+
+        Returns:
+            SparseCorrelation: This model.
+        """
+        return self
+
+    @staticmethod
+    def get_model_header(dataset):
+        """
+        Builds the header that a saved model has to match to be loaded.
+
+        Args:
+            dataset (Enum): The dataset of the model.
+
+        Returns:
+            dict: The model version, dataset, GPS limits, grid size and neighbor range.
+        """
+        gps_limit = Configuration.GPS_LIMITS[dataset.value]
+        return {
+            "version": SparseCorrelation.MODEL_VERSION,
+            "dataset": dataset.value,
+            "gps_limit": {key: list(value) for key, value in gps_limit.items()},
+            "grid_size": Configuration.GRID_SIZE,
+            "neighbor_range": Configuration.NEIGHBOR_RANGE,
+        }
+
+    def save(self, path, dataset):
+        """
+        Saves the model as memory-mappable arrays plus a small header.
+
+        The previous header is removed before any array is overwritten and the new one is
+        moved into place last, so an interrupted save is never loaded.
+
+        Args:
+            path (str): The directory to write the model to.
+            dataset (Enum): The dataset the model was built for.
+        """
+        Path(path).mkdir(parents=True, exist_ok=True)
+        header_path = Path(path, "header.json")
+        header_path.unlink(missing_ok=True)
+        arrays = {
+            "transition_count_indptr": self.transition_counts.indptr,
+            "transition_count_indices": self.transition_counts.indices,
+            "transition_count_data": self.transition_counts.data,
+            "transition_indptr": self.transition_matrix.indptr,
+            "transition_indices": self.transition_matrix.indices,
+            "transition_probs": self.transition_matrix.data,
+            "transition_cells": self.transition_cells,
+            "emission_counts": self.emission_counts,
+            "emission_indptr": self.emission_indptr,
+            "emission_cells": self.emission_cells,
+            "emission_probs": self.emission_probs,
+        }
+        for name, array in arrays.items():
+            np.save(Path(path, "{}.npy".format(name)), array)
+        with open(str(header_path) + ".tmp", "w") as f:
+            json.dump(SparseCorrelation.get_model_header(dataset), f)
+        os.replace(str(header_path) + ".tmp", header_path)
+
+    @staticmethod
+    def load(path, dataset):
+        """
+        Loads a saved model with its arrays memory-mapped read-only.
+
+        Args:
+            path (str): The directory the model was saved to.
+            dataset (Enum): The dataset the model is expected to match.
+
+        Returns:
+            SparseCorrelation: The loaded model.
+
+        Raises:
+            RuntimeError: If the model was saved for different GPS limits, grid size or neighbor range.
+        """
+        with open(Path(path, "header.json"), "r") as f:
+            header = json.load(f)
+        expected_header = SparseCorrelation.get_model_header(dataset)
+        if header != expected_header:
+            raise RuntimeError(
+                "Stale correlation model at {}: expected {}, found {}.".format(
+                    path, expected_header, header
+                )
+            )
+        Configuration.GPS_LIMIT = Configuration.GPS_LIMITS[dataset.value]
+        return SparseCorrelation.open_model(path)
+
+    @staticmethod
+    def open_model(path, grid_size=None):
+        """
+        Memory-maps the arrays of a saved model without validating its header.
+
+        Args:
+            path (str): The directory the model was saved to.
+            grid_size (int, optional): The grid size of the model. Defaults to None (Configuration.GRID_SIZE).
+
+        Returns:
+            SparseCorrelation: The model backed by the memory-mapped arrays.
+        """
+        if grid_size is None:
+            grid_size = Configuration.GRID_SIZE
+
+        def open_array(name):
+            return np.load(Path(path, "{}.npy".format(name)), mmap_mode="r")
+
+        size = grid_size**2
+        correlation = SparseCorrelation.__new__(SparseCorrelation)
+        correlation.grid_size = grid_size
+        correlation.transition_counts = sparse.csr_matrix(
+            (
+                open_array("transition_count_data"),
+                open_array("transition_count_indices"),
+                open_array("transition_count_indptr"),
+            ),
+            shape=(size, size),
+            copy=False,
+        )
+        correlation.transition_matrix = sparse.csr_matrix(
+            (
+                open_array("transition_probs"),
+                open_array("transition_indices"),
+                open_array("transition_indptr"),
+            ),
+            shape=(size, size),
+            copy=False,
+        )
+        correlation.transition_counts.has_sorted_indices = True
+        correlation.transition_matrix.has_sorted_indices = True
+        correlation.transition_cells = open_array("transition_cells")
+        correlation.emission_counts = open_array("emission_counts")
+        correlation.emission_indptr = open_array("emission_indptr")
+        correlation.emission_cells = open_array("emission_cells")
+        correlation.emission_probs = open_array("emission_probs")
+        correlation.model_path = str(path)
+        return correlation
+
+    def __reduce__(self):
+        """
+        Pickles a model opened from disk by its path, so worker processes map the same files.
+
+        The grid size travels with the path, since a worker unpickles the model before its
+        Configuration is set up.
+        """
+        if getattr(self, "model_path", None):
+            return SparseCorrelation.open_model, (self.model_path, self.grid_size)
+        return super().__reduce__()
+
+
+class CandidateCache:
+    """
+    A bounded LRU cache of the candidate tiers, emission candidates and sparse conversions
+    of correlation models.
+
+    The entries of each model live in a WeakKeyDictionary, so they are dropped with the model
+    and never stored on it. Frozen models stay free of mutable state and can be shared
+    across threads; the cache itself is guarded by a lock.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty cache.
+        """
+        self.lock = threading.Lock()
+        self.models = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+
+        # Hits and misses of each model, dropped with the model as well
+        self.counters = weakref.WeakKeyDictionary()
+
+    def get(self, correlation, key, build):
+        """
+        Retrieves the entry of a key for a model, building it on a miss.
+
+        At most Configuration.CANDIDATE_CACHE_SIZE entries are kept per model.
+
+        Args:
+            correlation (Correlation): The correlation model.
+            key (tuple): The key of the entry.
+            build (callable): Builds the entry on a miss.
+
+        Returns:
+            object: The cached entry.
+        """
+        with self.lock:
+            counters = self.counters.setdefault(correlation, [0, 0])
+            entries = self.models.get(correlation)
+            if entries is not None and key in entries:
+                entries.move_to_end(key)
+                self.hits += 1
+                counters[0] += 1
+                return entries[key]
+            self.misses += 1
+            counters[1] += 1
+
+        entry = build()
+
+        with self.lock:
+            entries = self.models.setdefault(correlation, OrderedDict())
+            entries[key] = entry
+            while len(entries) > Configuration.CANDIDATE_CACHE_SIZE:
+                entries.popitem(last=False)
+        return entry
+
+    def get_tiers(self, correlation, prev_point, tau):
+        """
+        Retrieves the candidate and tau tiers of (prev, tau), building them on a miss.
+
+        Args:
+            correlation (Correlation): The correlation model.
+            prev_point (tuple): The previous point as a tuple (x, y).
+            tau (float): The correlation threshold.
+
+        Returns:
+            tuple: The read-only (cells, probs) arrays of the candidates and the tau candidates.
+        """
+        return self.get(
+            correlation,
+            ("transition", tuple(prev_point), tau),
+            lambda: correlation.build_candidate_tiers(prev_point, tau),
+        )
+
+    def get_info(self, correlation=None):
+        """
+        Reports the usage of the cache.
+
+        Args:
+            correlation (Correlation, optional): The model to report on. Defaults to None (all models).
+
+        Returns:
+            dict: The hits, misses and current size of the model, or of all models, and the
+                capacity per model of the cache.
+        """
+        with self.lock:
+            if correlation is None:
+                hits, misses = self.hits, self.misses
+                size = sum(len(entries) for entries in self.models.values())
+            else:
+                hits, misses = self.counters.get(correlation, (0, 0))
+                size = len(self.models.get(correlation, ()))
+            return {
+                "hits": hits,
+                "misses": misses,
+                "size": size,
+                "max_size": Configuration.CANDIDATE_CACHE_SIZE,
+            }
+
+    def clear(self):
+        """
+        Empties the cache and resets its counters.
+
+        Returns:
+            None
+        """
+        with self.lock:
+            self.models = weakref.WeakKeyDictionary()
+            self.hits = 0
+            self.misses = 0
+            self.counters = weakref.WeakKeyDictionary()
+
+
+candidate_cache = CandidateCache()
@@ -1,5 +1,6 @@
 from imports import *
 from configuration import *
+from fingerprinting import *
 
 
 class Detection:
@@ -19,21 +20,412 @@ class Detection:
         Returns:
             tuple: The index of the most similar candidate trajectory and the similarity scores.
         """
-        scores = np.zeros((len(candidates),))
-        length = len(leak_trajectory)
+        return Detection.similarity_detection_array(
+            [(leak_lat, leak_lng) for leak_lat, leak_lng, _ in leak_trajectory],
+            [
+                [
+                    (cand_lat, cand_lng)
+                    for cand_lat, cand_lng, _ in cand_trajectory[: len(leak_trajectory)]
+                ]
+                for cand_trajectory, _ in candidates
+            ],
+        )
 
-        for i, (leak_lat, leak_lng, _) in enumerate(leak_trajectory):
-            suspects = []
-            for j, (cand_trajectory, _) in enumerate(candidates):
-                cand_lat, cand_lng, _ = cand_trajectory[i]
-                suspects.append((leak_lat - cand_lat) ** 2 + (leak_lng - cand_lng) ** 2)
+    @staticmethod
+    def get_scores(counts, length):
+        """
+        Turns the number of positions where each candidate is among the closest into scores.
+
+        A candidate gains 1 / length per such position. The gains are summed in order, as
+        the original per-position loop did, so the floating point scores match it exactly.
+
+        Args:
+            counts (np.ndarray): The number of closest positions of each candidate.
+            length (int): The length of the leak.
+
+        Returns:
+            np.ndarray: The similarity score of each candidate.
+        """
+        length = max(length, 1)
+        steps = np.cumsum(np.full(length, 1 / length))
+        return np.where(counts > 0, steps[np.maximum(counts, 1) - 1], 0.0)
+
+    @staticmethod
+    def similarity_detection_array(leak_cells, candidate_cells):
+        """
+        Performs similarity detection on stacked arrays of cells.
+
+        A candidate scores 1 / length at every position where it is among the closest
+        candidates to the leak, ties included.
+
+        Args:
+            leak_cells (np.ndarray): The leak cells (length x 2).
+            candidate_cells (np.ndarray): The candidate cells (parties x length x 2).
+
+        Returns:
+            tuple: The index of the most similar candidate and the similarity scores.
+        """
+        leak_cells = np.asarray(leak_cells).reshape(-1, 2)
+        length = len(leak_cells)
+        candidate_cells = np.asarray(candidate_cells)
+        if length == 0:
+            return 0, np.zeros((len(candidate_cells),))
 
-            min_value = min(suspects)
-            suspects = list(
-                filter(lambda x: suspects[x] == min_value, range(len(suspects)))
+        distances = ((candidate_cells[:, :length] - leak_cells) ** 2).sum(axis=2)
+        counts = (distances == distances.min(axis=0)).sum(axis=1)
+
+        scores = Detection.get_scores(counts, length)
+        return np.argmax(scores), scores
+
+    @staticmethod
+    def sequential_detection(
+        leak_cells, candidate_cells, confidence=None, block_size=8
+    ):
+        """
+        Performs similarity detection position by position and stops once the leader is decided.
+
+        Without a confidence, scoring stops when the margin of the leader over the runner-up
+        exceeds the number of positions left, so the index equals the one of
+        similarity_detection_array. With a confidence, it also stops once the runner-up
+        catching up over the remaining positions, modelled as a zero-mean walk with steps
+        in [-1, 1], has a Hoeffding probability of at most 1 - confidence.
+
+        Args:
+            leak_cells (np.ndarray): The leak cells (length x 2).
+            candidate_cells (np.ndarray): The candidate cells (parties x length x 2).
+            confidence (float, optional): The confidence to stop at. Defaults to None (exact).
+            block_size (int, optional): The number of positions scored per step. Defaults to 8.
+
+        Returns:
+            tuple: The index of the most similar candidate, the scores of the inspected
+                positions and the number of positions inspected.
+        """
+        leak_cells = np.asarray(leak_cells).reshape(-1, 2)
+        length = len(leak_cells)
+        candidate_cells = np.asarray(candidate_cells)
+        counts = np.zeros(len(candidate_cells), dtype=np.int64)
+        inspected = 0
+
+        while inspected < length:
+            block = slice(inspected, min(inspected + block_size, length))
+            distances = ((candidate_cells[:, block] - leak_cells[block]) ** 2).sum(
+                axis=2
+            )
+            block_counts = counts[:, None] + np.cumsum(
+                distances == distances.min(axis=0), axis=1
             )
 
-            for suspect in suspects:
-                scores[suspect] += 1 / length
+            leader = block_counts.max(axis=0)
+            if len(block_counts) > 1:
+                runner_up = np.partition(block_counts, -2, axis=0)[-2]
+            else:
+                runner_up = np.zeros_like(leader)
+            margin = leader - runner_up
+            remaining = length - np.arange(block.start + 1, block.stop + 1)
+            decided = margin > remaining
+            if confidence is not None:
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    decided |= (
+                        np.exp(-(margin**2) / (2 * np.maximum(remaining, 0)))
+                        <= 1 - confidence
+                    )
 
+            stops = np.flatnonzero(decided)
+            if len(stops):
+                counts = block_counts[:, stops[0]]
+                inspected = block.start + stops[0] + 1
+                break
+            counts = block_counts[:, -1]
+            inspected = block.stop
+
+        scores = Detection.get_scores(counts, length)
+        return np.argmax(scores), scores, inspected
+
+    @staticmethod
+    def similarity_detection_indexed(leak_cells, detection_index):
+        """
+        Performs similarity detection through an inverted index of the candidates.
+
+        Gives the same index and scores as similarity_detection_array while the work grows
+        with the number of distinct cells per position instead of the number of parties.
+
+        Args:
+            leak_cells (np.ndarray): The leak cells (length x 2).
+            detection_index (DetectionIndex): The index of the candidate copies.
+
+        Returns:
+            tuple: The index of the most similar candidate and the similarity scores.
+        """
+        leak_cells = np.asarray(leak_cells).reshape(-1, 2).tolist()
+        length = len(leak_cells)
+        if length == 0:
+            return 0, np.zeros((detection_index.party_count,))
+
+        suspects = [
+            detection_index.get_suspects(i, leak_cell)
+            for i, leak_cell in enumerate(leak_cells)
+        ]
+        counts = np.bincount(
+            np.concatenate(suspects), minlength=detection_index.party_count
+        )
+
+        scores = Detection.get_scores(counts, length)
         return np.argmax(scores), scores
+
+    @staticmethod
+    def regenerate_copies(
+        trajectory, party_keys, tau, p, theta, correlation, chunk_size=64, n_jobs=1
+    ):
+        """
+        Lazily regenerates the fingerprinted copies of a trajectory from the key registry.
+
+        Each chunk of parties is one task fingerprinted together with
+        Fingerprinting.keyed_fingerprint_many, so the correlation model is sent once per chunk.
+
+        Args:
+            trajectory (list): The base trajectory.
+            party_keys (list): The key of each party, indexed by party.
+            tau (float): The transition threshold for sampling candidates.
+            p (float): The initial probability of fingerprinting a cell.
+            theta (float): The adjustment parameter for the probability.
+            correlation (Correlation): The correlation model used for fingerprinting.
+            chunk_size (int, optional): The number of parties per chunk. Defaults to 64.
+            n_jobs (int, optional): The number of chunks regenerated in parallel. Defaults to 1.
+
+        Yields:
+            list: The copies of the next chunk of parties as tuples (trajectory, flags).
+        """
+        with Parallel(n_jobs=n_jobs, return_as="generator") as parallel:
+            yield from parallel(
+                delayed(Fingerprinting.keyed_fingerprint_many)(
+                    trajectory,
+                    party_keys[start : start + chunk_size],
+                    tau,
+                    p,
+                    theta,
+                    correlation,
+                )
+                for start in range(0, len(party_keys), chunk_size)
+            )
+
+    @staticmethod
+    def keyed_detection(
+        leak_trajectory,
+        trajectory,
+        party_keys,
+        tau,
+        p,
+        theta,
+        correlation,
+        chunk_size=64,
+        n_jobs=1,
+    ):
+        """
+        Performs similarity detection against copies regenerated from the key registry.
+
+        The copies are regenerated one chunk of parties at a time, so only the cells needed
+        for scoring are held and no copy has to be stored.
+
+        Args:
+            leak_trajectory (list): The leak trajectory as a list of tuples (lat, lng, _).
+            trajectory (list): The base trajectory the copies were generated from.
+            party_keys (list): The key of each party, indexed by party.
+            tau (float): The transition threshold for sampling candidates.
+            p (float): The initial probability of fingerprinting a cell.
+            theta (float): The adjustment parameter for the probability.
+            correlation (Correlation): The correlation model used for fingerprinting.
+            chunk_size (int, optional): The number of parties per chunk. Defaults to 64.
+            n_jobs (int, optional): The number of chunks regenerated in parallel. Defaults to 1.
+
+        Returns:
+            tuple: The index of the most similar party and the similarity scores.
+        """
+        candidate_cells = []
+        for chunk in Detection.regenerate_copies(
+            trajectory,
+            party_keys,
+            tau,
+            p,
+            theta,
+            correlation,
+            chunk_size=chunk_size,
+            n_jobs=n_jobs,
+        ):
+            for cand_trajectory, _ in chunk:
+                candidate_cells.append(
+                    [
+                        (cand_lat, cand_lng)
+                        for cand_lat, cand_lng, _ in cand_trajectory[
+                            : len(leak_trajectory)
+                        ]
+                    ]
+                )
+
+        return Detection.similarity_detection_array(
+            [(leak_lat, leak_lng) for leak_lat, leak_lng, _ in leak_trajectory],
+            candidate_cells,
+        )
+
+
+class DetectionIndex:
+    """
+    An inverted index of the fingerprinted copies of one base trajectory.
+
+    For each position, the parties are grouped by the cell their copy holds.
+    """
+
+    def __init__(self, candidate_cells):
+        """
+        Builds the index from stacked candidate copies.
+
+        Args:
+            candidate_cells (np.ndarray): The candidate cells (parties x length x 2).
+        """
+        candidate_cells = np.asarray(candidate_cells)
+        self.party_count = len(candidate_cells)
+        self.positions = []
+        if candidate_cells.size == 0:
+            return
+
+        keys = Coordinates.get_cell_keys(candidate_cells)
+        for i in range(candidate_cells.shape[1]):
+            order = np.argsort(keys[:, i], kind="stable")
+            _, starts = np.unique(keys[order, i], return_index=True)
+            cells = candidate_cells[order[starts], i]
+            parties = np.split(order, starts[1:])
+            self.positions.append(
+                (cells, dict(zip(map(tuple, cells.tolist()), parties)), parties)
+            )
+
+    def get_suspects(self, position, cell):
+        """
+        Finds the parties whose copy is closest to a cell at one position.
+
+        Exact matches are looked up; the distance search over the distinct cells of the
+        position only runs when no party holds the cell.
+
+        Args:
+            position (int): The position in the trajectory.
+            cell (tuple): The leaked cell.
+
+        Returns:
+            np.ndarray: The indexes of the closest parties.
+        """
+        cells, lookup, parties = self.positions[position]
+        suspects = lookup.get(tuple(cell))
+        if suspects is not None:
+            return suspects
+        distances = ((cells - np.asarray(cell)) ** 2).sum(axis=1)
+        return np.concatenate(
+            [parties[j] for j in np.flatnonzero(distances == distances.min())]
+        )
+
+
+class StreamingDetector:
+    """
+    Attributes a leak that arrives point by point.
+
+    The detector holds the candidate copies and the running hit count of every party, so each
+    leaked point costs O(parties). Once the whole leak is consumed, the leader is the index
+    returned by similarity_detection.
+    """
+
+    def __init__(self, candidate_cells):
+        """
+        Initializes the detector.
+
+        Args:
+            candidate_cells (np.ndarray): The candidate cells (parties x length x 2).
+        """
+        self.candidate_cells = np.asarray(candidate_cells)
+        self.counts = np.zeros(len(self.candidate_cells), dtype=np.int64)
+        self.position = 0
+
+    def update(self, point):
+        """
+        Scores the next leaked point.
+
+        Args:
+            point (tuple): The leaked point as (lat, lng) or (lat, lng, _).
+
+        Returns:
+            int: The current leader.
+        """
+        if self.position >= self.candidate_cells.shape[1]:
+            raise RuntimeError("Leak is longer than the candidate copies.")
+        distances = (
+            (self.candidate_cells[:, self.position] - np.asarray(point[:2])) ** 2
+        ).sum(axis=1)
+        self.counts += distances == distances.min()
+        self.position += 1
+        return self.get_leader()
+
+    def update_batch(self, points):
+        """
+        Scores the next leaked points in order.
+
+        Args:
+            points (list): The leaked points as (lat, lng) or (lat, lng, _).
+
+        Returns:
+            int: The current leader.
+        """
+        for point in points:
+            self.update(point)
+        return self.get_leader()
+
+    async def consume(self, batches):
+        """
+        Scores batches of leaked points from an asynchronous feed.
+
+        Control is handed back to the event loop after every batch.
+
+        Args:
+            batches (AsyncIterable): The feed of point batches.
+
+        Yields:
+            tuple: The leader and its margin after each batch.
+        """
+        async for points in batches:
+            self.update_batch(points)
+            yield self.get_leader(), self.get_margin()
+            await asyncio.sleep(0)
+
+    def get_leader(self):
+        """
+        Finds the current leader.
+
+        Returns:
+            int: The party with the most closest matches so far, the lowest index on ties.
+        """
+        return int(np.argmax(self.counts))
+
+    def get_margin(self):
+        """
+        Computes the margin of the leader over the runner-up.
+
+        Returns:
+            int: The number of matches of the leader over the runner-up.
+        """
+        if len(self.counts) < 2:
+            return int(self.counts.max(initial=0))
+        runner_up, leader = np.partition(self.counts, -2)[-2:]
+        return int(leader - runner_up)
+
+    def get_scores(self):
+        """
+        Computes the running similarity scores.
+
+        Returns:
+            np.ndarray: The share of the positions seen so far at which each party was closest.
+        """
+        return self.counts / max(self.position, 1)
+
+    def is_decided(self):
+        """
+        Checks whether the leader is decided.
+
+        Returns:
+            bool: Whether the rest of the copies can no longer change the leader.
+        """
+        return self.get_margin() > self.candidate_cells.shape[1] - self.position
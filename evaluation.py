@@ -123,6 +123,9 @@ class Evaluation:
         p_estimate=None,
         debug=False,
         parallel=False,
+        sequential=False,
+        confidence=None,
+        seed=None,
     ):
         """
         Evaluate the detection accuracy of a privacy-preserving technique.
@@ -144,6 +147,9 @@ class Evaluation:
             p_estimate (float, optional): The probability estimate for probabilistic collusion attack. Defaults to None.
             debug (bool, optional): Enable debug mode. Defaults to False.
             parallel (bool, optional): Enable parallel execution. Defaults to False.
+            sequential (bool, optional): Stop detection once the leader is decided. Defaults to False.
+            confidence (float, optional): The confidence at which sequential detection stops early. Defaults to None (exact).
+            seed (int, optional): The seed of the trial streams, which makes runs reproducible at any worker count. Defaults to None (drawn from the global numpy stream).
 
         Returns:
             float: The average detection accuracy.
@@ -164,100 +170,115 @@ class Evaluation:
             collusion_count,
             p_estimate,
             debug,
+            sequential,
+            confidence,
+            rng,
         ):
             if debug:
                 print("Trial # {}".format(trial_index))
-            selected_trajectories = Sampling.sample_count(data, trajectory_count)
+            selected_trajectories = Sampling.sample_count(data, trajectory_count, rng)
 
-            copies = [[] for _ in range(party_count)]
-            aux_info = []
+            # every party draws its copies from its own stream
+            party_rngs = rng.spawn(party_count)
+
+            candidate_cells = []
             for trajectory_id, selected_trajectory in enumerate(selected_trajectories):
                 selected_trajectory = selected_trajectory[:trajectory_length]
 
                 if debug:
                     print("Generating fingerprinted copies.")
 
-                for party_index in range(party_count):
-                    copies[party_index].append(
-                        Fingerprinting.probabilistic_fingerprint(
-                            selected_trajectory,
-                            tau,
-                            fp_ratio,
-                            theta,
-                            correlation_model,
-                            debug=False,
-                        )
-                    )
+                fp_cells, _ = Fingerprinting.probabilistic_fingerprint_many(
+                    selected_trajectory,
+                    party_count,
+                    tau,
+                    fp_ratio,
+                    theta,
+                    correlation_model,
+                    party_rngs=party_rngs,
+                )
+                candidate_cells.append(fp_cells)
 
-            results = np.zeros(sub_trial_rep_count)
             if debug:
                 print("Performing attack...")
-            for sub_trial_index in range(sub_trial_rep_count):
-                if (
-                    attack == Attack.correlation_attack
-                    or attack == Attack.random_distortion_attack
-                ):
-                    assert attack_ratio
-                    leak_party_indexes = Sampling.sample_count(party_count, 1)
-                else:
-                    assert collusion_count > 1
-                    leak_party_indexes = Sampling.sample_count(
-                        party_count, collusion_count
-                    )
+            if (
+                attack == Attack.correlation_attack
+                or attack == Attack.random_distortion_attack
+            ):
+                assert attack_ratio
+                leak_count = 1
+            else:
+                assert collusion_count > 1
+                leak_count = collusion_count
+            leak_party_indexes = np.array(
+                [
+                    Sampling.sample_count(party_count, leak_count, rng)
+                    for _ in range(sub_trial_rep_count)
+                ]
+            )
 
-                sus_list = []
+            # Every attack runs once over the leaks of all sub-trials
+            sus_lists = [[] for _ in range(sub_trial_rep_count)]
+            for trajectory_idx in range(trajectory_count):
+                victim_cells = candidate_cells[trajectory_idx][leak_party_indexes]
+                if attack == Attack.random_distortion_attack:
+                    leak_cells = Attack.random_distortion_attack_batch(
+                        victim_cells[:, 0], attack_ratio, rng
+                    )
+                elif attack == Attack.correlation_attack:
+                    leak_cells = Attack.correlation_attack_batch(
+                        victim_cells[:, 0], tau, attack_ratio, correlation_model, rng
+                    )
+                elif attack == Attack.majority_collusion_attack:
+                    leak_cells = Attack.majority_collusion_attack_batch(
+                        victim_cells, rng
+                    )
+                elif attack == Attack.probabilistic_collusion_attack:
+                    assert p_estimate
+                    leak_cells = Attack.probabilistic_collusion_attack_batch(
+                        victim_cells,
+                        p_estimate,
+                        tau,
+                        correlation_model,
+                        attack_ratio,
+                        rng,
+                    )
 
-                for trajectory_idx in range(trajectory_count):
-                    if attack == Attack.random_distortion_attack:
-                        victim_trajectory = copies[leak_party_indexes[0]][
-                            trajectory_idx
-                        ][0]
-                        leak_trajectory = Attack.random_distortion_attack(
-                            victim_trajectory, attack_ratio
-                        )
-                    if attack == Attack.correlation_attack:
-                        victim_trajectory = copies[leak_party_indexes[0]][
-                            trajectory_idx
-                        ][0]
-                        leak_trajectory = Attack.correlation_attack(
-                            victim_trajectory, tau, attack_ratio, correlation_model
+                if debug:
+                    print("Detecting...")
+                if not sequential:
+                    # the copies are shared by all sub-trials, so index them once
+                    detection_index = DetectionIndex(candidate_cells[trajectory_idx])
+                for sub_trial_index in range(sub_trial_rep_count):
+                    if sequential:
+                        sus, scores, inspected = Detection.sequential_detection(
+                            leak_cells[sub_trial_index],
+                            candidate_cells[trajectory_idx],
+                            confidence=confidence,
                         )
-                    else:
-                        victim_trajectories = [
-                            copies[party_index][trajectory_idx][0]
-                            for party_index in leak_party_indexes
-                        ]
-                        if attack == Attack.majority_collusion_attack:
-                            leak_trajectory = Attack.majority_collusion_attack(
-                                victim_trajectories
-                            )
-                        elif attack == Attack.probabilistic_collusion_attack:
-                            assert p_estimate
-                            leak_trajectory = Attack.probabilistic_collusion_attack(
-                                victim_trajectories,
-                                p_estimate,
-                                tau,
-                                correlation_model,
-                                attack_ratio=attack_ratio,
+                        if debug:
+                            print(
+                                "Inspected {} of {} positions.".format(
+                                    inspected, leak_cells.shape[1]
+                                )
                             )
+                    else:
+                        sus, scores = Detection.similarity_detection_indexed(
+                            leak_cells[sub_trial_index], detection_index
+                        )
+                    sus_lists[sub_trial_index].append(sus)
 
-                    if debug:
-                        print("Detecting...")
-                    sus, scores = Detection.similarity_detection(
-                        leak_trajectory,
-                        [
-                            copies[party_index][trajectory_idx]
-                            for party_index in range(party_count)
-                        ],
-                    )
-                    sus_list.append(sus)
+            results = np.zeros(sub_trial_rep_count)
+            for sub_trial_index, sus_list in enumerate(sus_lists):
                 results[sub_trial_index] = (
                     1
-                    if max(set(sus_list), key=sus_list.count) in leak_party_indexes
+                    if max(set(sus_list), key=sus_list.count)
+                    in leak_party_indexes[sub_trial_index]
                     else 0
                 )
             return np.mean(results)
 
+        trial_streams = RandomStream(seed).spawn(trial_rep_count)
         if parallel:
             results = Parallel(n_jobs=16)(
                 delayed(single_trial)(
@@ -275,6 +296,9 @@ class Evaluation:
                     collusion_count,
                     p_estimate,
                     debug,
+                    sequential,
+                    confidence,
+                    trial_streams[trial_index],
                 )
                 for trial_index in range(trial_rep_count)
             )
@@ -297,6 +321,9 @@ class Evaluation:
                         collusion_count,
                         p_estimate,
                         debug,
+                        sequential,
+                        confidence,
+                        trial_streams[trial_index],
                     )
                 )
         return np.mean(results)
@@ -5,7 +5,9 @@ from sampling import *
 
 class Fingerprinting:
     @staticmethod
-    def probabilistic_fingerprint(trajectory, tau, p, theta, correlation, debug=False):
+    def probabilistic_fingerprint(
+        trajectory, tau, p, theta, correlation, debug=False, rng=random
+    ):
         """
         Generate a probabilistic fingerprint for a trajectory.
 
@@ -16,6 +18,7 @@ class Fingerprinting:
             theta (float): The adjustment parameter for the probability.
             correlation (Correlation): The correlation model for emission and transition probabilities.
             debug (bool, optional): Enable debug mode. Defaults to False.
+            rng (RandomStream, optional): The random stream to draw from. Defaults to the global numpy stream.
 
         Returns:
             tuple: The fingerprinted trajectory and the corresponding fingerprint flags.
@@ -47,15 +50,12 @@ class Fingerprinting:
         if debug:
             print("First cell truth: %5d, %5d, %10.2f" % (x_cell, y_cell, true_time))
 
-        # Extract the emission
-        distribution = correlation.get_emission((x_cell, y_cell))
-
         # Sample from the emission probabilities
-        (
-            sampled_lat,
-            sampled_lng,
-        ), fp_state = Sampling.sample_proportionally_with_truth(
-            distribution, (x_cell, y_cell), p_current
+        sampled_cells, fp_states = Sampling.sample_emission(
+            correlation, (x_cell, y_cell), p_current, [rng.random()]
+        )
+        (sampled_lat, sampled_lng), fp_state = sampled_cells[0].tolist(), int(
+            fp_states[0]
         )
         if debug:
             print("Sampled: ", sampled_lat, sampled_lng, "FP:", fp_state)
@@ -90,6 +90,7 @@ class Fingerprinting:
                 correlation,
                 replace=True,
                 debug=False,
+                rng=rng,
             )
 
             if debug:
@@ -138,3 +139,247 @@ class Fingerprinting:
                 block_count = 0
 
         return fp_trajectory, fp_flag
+
+    @staticmethod
+    def probabilistic_fingerprint_many(
+        trajectory,
+        n_parties,
+        tau,
+        p,
+        theta,
+        correlation,
+        replace=True,
+        rng=random,
+        party_rngs=None,
+    ):
+        """
+        Generate probabilistic fingerprints of one trajectory for many parties at once.
+
+        All parties advance together over the trajectory. Parties sharing the previous cell
+        share one candidate set, and every step takes a single vectorized draw for all parties.
+        Each party follows the same distribution as probabilistic_fingerprint.
+
+        Args:
+            trajectory (list): The trajectory to generate the fingerprints for.
+            n_parties (int): The number of parties.
+            tau (float): The transition threshold for sampling candidates.
+            p (float): The initial probability of fingerprinting a cell.
+            theta (float): The adjustment parameter for the probability.
+            correlation (Correlation): The correlation model for emission and transition probabilities.
+            replace (bool, optional): Replace an unreachable truth by the closest candidate. Defaults to True.
+            rng (RandomStream, optional): The random stream to draw from. Defaults to the global numpy stream.
+            party_rngs (list, optional): One random stream per party, each drawing that party's
+                numbers, so a party's copy does not depend on the other parties. Defaults to None (all draw from rng).
+
+        Returns:
+            tuple: The fingerprinted cells (parties x length x 2) and the fingerprint flags (parties x length).
+        """
+        assert p >= 0
+        assert party_rngs is None or len(party_rngs) == n_parties
+
+        def draw():
+            if party_rngs is None:
+                return rng.random(n_parties)
+            return np.array([party_rng.random() for party_rng in party_rngs])
+
+        true_cells = np.array(
+            [(x_cell, y_cell) for x_cell, y_cell, _ in trajectory], dtype=np.int64
+        )
+        length = len(true_cells)
+        fp_cells = np.empty((n_parties, length, 2), dtype=np.int64)
+        fp_flags = np.zeros((n_parties, length), dtype=np.int64)
+
+        if p == 0:
+            fp_cells[:] = true_cells
+            return fp_cells, fp_flags
+
+        # Block count for p adjustment, shared since all parties advance together
+        block_count = 0
+
+        # Fingerprint count and p value of each party
+        fp_count = np.zeros(n_parties, dtype=np.int64)
+        p_current = np.full(n_parties, p, dtype=np.float64)
+
+        # First entry
+        true_cell = tuple(true_cells[0].tolist())
+        fp_cells[:, 0], fp_flags[:, 0] = Sampling.sample_emission(
+            correlation, true_cell, p_current, draw()
+        )
+        fp_count += fp_flags[:, 0]
+        block_count += 1
+
+        # The rest entries
+        for i in range(1, length):
+            true_cell = tuple(true_cells[i].tolist())
+            fp_cells[:, i], fp_flags[:, i] = Sampling.sample_candidates_batch(
+                fp_cells[:, i - 1],
+                np.broadcast_to(true_cells[i], (n_parties, 2)),
+                p_current,
+                tau,
+                correlation,
+                replace,
+                draws=draw(),
+            )
+
+            fp_count += fp_flags[:, i]
+            block_count += 1
+
+            # Check block count
+            if block_count >= math.ceil(1 / p):
+                expected = p * (i + 1)
+                p_current = np.where(
+                    fp_count > expected,
+                    p * (1 - theta),
+                    np.where(fp_count < expected, p * (1 + theta), p),
+                )
+                p_current = np.minimum(p_current, 1)
+                block_count = 0
+
+        return fp_cells, fp_flags
+
+    @staticmethod
+    def generate_party_keys(n_parties, seed=None):
+        """
+        Generates the secret fingerprinting key of each party.
+
+        Args:
+            n_parties (int): The number of parties.
+            seed (int, optional): The seed of the key generator. Defaults to None (fresh OS entropy).
+
+        Returns:
+            list: One 64-bit integer key per party.
+        """
+        return (
+            np.random.SeedSequence(seed)
+            .generate_state(n_parties, dtype=np.uint64)
+            .tolist()
+        )
+
+    @staticmethod
+    def save_party_keys(path, party_keys):
+        """
+        Saves the key registry of the parties.
+
+        Args:
+            path (str): The registry file.
+            party_keys (list): The key of each party, indexed by party.
+
+        Returns:
+            None
+        """
+        with open(path, "w") as f:
+            json.dump([int(party_key) for party_key in party_keys], f)
+
+    @staticmethod
+    def load_party_keys(path):
+        """
+        Loads the key registry of the parties.
+
+        Args:
+            path (str): The registry file.
+
+        Returns:
+            list: The key of each party, indexed by party.
+        """
+        with open(path, "r") as f:
+            return json.load(f)
+
+    @staticmethod
+    def get_party_rng(trajectory, party_key, tau, p, theta):
+        """
+        Derives the random stream of one party's copy of a trajectory.
+
+        The stream is seeded by a SeedSequence whose entropy is the party key and whose
+        spawn key is a digest of the trajectory and the fingerprinting parameters.
+
+        Args:
+            trajectory (list): The base trajectory.
+            party_key (int): The secret key of the party.
+            tau (float): The transition threshold for sampling candidates.
+            p (float): The initial probability of fingerprinting a cell.
+            theta (float): The adjustment parameter for the probability.
+
+        Returns:
+            RandomStream: The keyed random stream.
+        """
+        digest = hashlib.sha256(
+            json.dumps(
+                [
+                    [[int(x_cell), int(y_cell)] for x_cell, y_cell, _ in trajectory],
+                    tau,
+                    p,
+                    theta,
+                ]
+            ).encode()
+        ).digest()
+        seed_sequence = np.random.SeedSequence(
+            int(party_key),
+            spawn_key=tuple(np.frombuffer(digest, dtype=np.uint32).tolist()),
+        )
+        return RandomStream(seed_sequence)
+
+    @staticmethod
+    def keyed_fingerprint(trajectory, party_key, tau, p, theta, correlation):
+        """
+        Generate the fingerprint of a party deterministically from its key.
+
+        The same trajectory, key, parameters and correlation model always give the same copy,
+        so copies can be regenerated from the key registry instead of being stored.
+
+        Args:
+            trajectory (list): The trajectory to generate the fingerprint for.
+            party_key (int): The secret key of the party.
+            tau (float): The transition threshold for sampling candidates.
+            p (float): The initial probability of fingerprinting a cell.
+            theta (float): The adjustment parameter for the probability.
+            correlation (Correlation): The correlation model for emission and transition probabilities.
+
+        Returns:
+            tuple: The fingerprinted trajectory and the corresponding fingerprint flags.
+        """
+        return Fingerprinting.keyed_fingerprint_many(
+            trajectory, [party_key], tau, p, theta, correlation
+        )[0]
+
+    @staticmethod
+    def keyed_fingerprint_many(trajectory, party_keys, tau, p, theta, correlation):
+        """
+        Generate the keyed fingerprints of many parties at once.
+
+        The parties advance together in probabilistic_fingerprint_many, each drawing from
+        its own keyed stream, so every copy equals the one keyed_fingerprint gives.
+
+        Args:
+            trajectory (list): The trajectory to generate the fingerprints for.
+            party_keys (list): The secret key of each party.
+            tau (float): The transition threshold for sampling candidates.
+            p (float): The initial probability of fingerprinting a cell.
+            theta (float): The adjustment parameter for the probability.
+            correlation (Correlation): The correlation model for emission and transition probabilities.
+
+        Returns:
+            list: The copy of each party as a tuple (trajectory, flags).
+        """
+        fp_cells, fp_flags = Fingerprinting.probabilistic_fingerprint_many(
+            trajectory,
+            len(party_keys),
+            tau,
+            p,
+            theta,
+            correlation,
+            party_rngs=[
+                Fingerprinting.get_party_rng(trajectory, party_key, tau, p, theta)
+                for party_key in party_keys
+            ],
+        )
+        times = [time for _, _, time in trajectory]
+        return [
+            (
+                [
+                    (x_cell, y_cell, time)
+                    for (x_cell, y_cell), time in zip(party_cells.tolist(), times)
+                ],
+                party_flags.tolist(),
+            )
+            for party_cells, party_flags in zip(fp_cells, fp_flags)
+        ]
@@ -7,9 +7,13 @@ import json
 from pathlib import Path
 from pathlib import PurePath
 from joblib import Parallel, delayed
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from collections import defaultdict
+from collections import OrderedDict
 from shapely.geometry import Polygon, Point
 from scipy.spatial import ConvexHull
+from scipy import sparse
+from scipy.signal import convolve2d
 import pandas as pd
 import math
 from dtaidistance import dtw_ndim
@@ -20,3 +24,9 @@ from bresenham import bresenham
 import os
 import warnings
 import shutil
+import time
+import functools
+import asyncio
+import hashlib
+import threading
+import weakref
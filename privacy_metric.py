@@ -5,202 +5,682 @@ from sampling import *
 
 
 class PrivacyMetric:
+    NOISE_BLOCK_SIZE = 8
+    # Number of noise candidates drawn at once when releasing a point.
+
+    worker_correlation = None
+    # Correlation model of a PIM worker process, set once by init_worker.
+
     @staticmethod
-    def pim(data, dataset, epsilon, delta_dp, correlation, copies=1):
+    def propagate_prior(cell_ids, probs, transition_matrix):
         """
-        Apply the PIM algorithm to generate differentially private copies of the input data.
+        Propagates a sparse distribution over the grid one step through the transition matrix.
+
+        Only the transition rows of the support are visited, so the cost scales with the
+        support size rather than with GRID_SIZE ** 2.
 
         Args:
-            data (list): The input trajectory data.
-            dataset (Dataset): The dataset being used.
+            cell_ids (np.ndarray): The cell ids of the distribution's support.
+            probs (np.ndarray): The probabilities of the support cells.
+            transition_matrix (scipy.sparse.csr_matrix): The row-stochastic transition matrix between cell ids.
+
+        Returns:
+            tuple: The propagated support as (cell_ids, probs), sorted by cell id.
+        """
+        starts = transition_matrix.indptr[cell_ids]
+        lengths = transition_matrix.indptr[cell_ids + 1] - starts
+        positions = np.repeat(
+            starts - np.cumsum(lengths) + lengths, lengths
+        ) + np.arange(lengths.sum())
+        next_ids, inverse = np.unique(
+            transition_matrix.indices[positions], return_inverse=True
+        )
+        next_probs = np.bincount(
+            inverse,
+            weights=transition_matrix.data[positions] * np.repeat(probs, lengths),
+            minlength=len(next_ids),
+        )
+        return next_ids, next_probs
+
+    @staticmethod
+    def get_location_set(cell_ids, probs, delta_dp):
+        """
+        Selects the delta-location set from the support of the prior.
+
+        Cells are taken by decreasing probability (ties by cell id) until the accumulated
+        probability reaches 1 - delta_dp.
+
+        Args:
+            cell_ids (np.ndarray): The cell ids of the prior's support.
+            probs (np.ndarray): The prior probabilities of the support cells.
+            delta_dp (float): The delta parameter for differential privacy.
+
+        Returns:
+            np.ndarray: The cell ids of the location set, most probable first.
+        """
+        order = np.argsort(-probs, kind="stable")
+        set_size = np.searchsorted(np.cumsum(probs[order]), 1 - delta_dp, side="left")
+        return cell_ids[order[: min(set_size + 1, len(order))]]
+
+    @staticmethod
+    def update_posterior(
+        prior_ids, prior_probs, released_cell, epsilon, t_value, area, tolerance=None
+    ):
+        """
+        Computes the posterior of the true location given the released cell.
+
+        The PIM noise kernel is evaluated with NumPy on the precomputed cell mesh. With a
+        tolerance, only the prior cells inside the square window where the kernel is at
+        least the tolerance are evaluated. The dropped likelihood mass is then at most
+        tolerance times the prior mass outside the window, which bounds the L1 error of
+        the posterior. A tolerance of zero, or one not below the peak of the kernel, would
+        leave an empty or unbounded window, so the kernel is then evaluated exactly.
+
+        Args:
+            prior_ids (np.ndarray): The cell ids of the prior's support.
+            prior_probs (np.ndarray): The prior probabilities of the support cells.
+            released_cell (tuple): The released cell as a tuple (x, y).
+            epsilon (float): The privacy parameter.
+            t_value (float): The isotropic scaling factor of the sensitivity hull.
+            area (float): The size of the sensitivity hull, i.e., its ConvexHull.area (the perimeter in 2-D).
+            tolerance (float, optional): The kernel value below which cells are dropped. Defaults to None (exact).
+
+        Returns:
+            tuple: The posterior as (cell_ids, probs) and the L1 error bound introduced by truncation.
+        """
+        mesh_x, mesh_y = Coordinates.get_cell_mesh(Configuration.GRID_SIZE)
+        scale = epsilon**2 / 2 / area
+        delta_x = released_cell[0] - mesh_x[prior_ids]
+        delta_y = released_cell[1] - mesh_y[prior_ids]
+
+        outside_mass = 0.0
+        truncate = tolerance is not None and 0 < tolerance < scale
+        if truncate:
+            radius = math.log(scale / tolerance) / (epsilon * t_value)
+            inside = (np.abs(delta_x) <= radius) & (np.abs(delta_y) <= radius)
+            outside_mass = prior_probs[~inside].sum()
+            prior_ids, prior_probs = prior_ids[inside], prior_probs[inside]
+            delta_x, delta_y = delta_x[inside], delta_y[inside]
+
+        prob_from = scale * np.exp(
+            -epsilon * t_value * np.sqrt(delta_x * delta_x + delta_y * delta_y)
+        )
+        weighted_probs = prior_probs * prob_from
+        sum_prob = weighted_probs.sum()
+
+        dropped_bound = tolerance * outside_mass if truncate else 0.0
+        if sum_prob <= 0:
+            return (
+                np.array([Coordinates.get_cell_id(released_cell)]),
+                np.ones(1),
+                2.0 if outside_mass > 0 else 0.0,
+            )
+        return (
+            prior_ids,
+            weighted_probs / sum_prob,
+            2 * dropped_bound / (sum_prob + dropped_bound),
+        )
+
+    @staticmethod
+    def get_sensitivity_hull(c_vertices):
+        """
+        Computes the sensitivity hull, i.e., the convex hull of all pairwise vertex differences.
+
+        For a convex polygon this is the Minkowski sum of the polygon and its reflection,
+        which is built in O(V) by merging the edges of both polygons by angle.
+
+        Args:
+            c_vertices (list): The vertices of the convex hull in counterclockwise order.
+
+        Returns:
+            tuple: The sensitivity hull vertices in counterclockwise order and its
+                ConvexHull.area (the perimeter in 2-D).
+        """
+
+        def from_lowest(vertices):
+            lowest = min(
+                range(len(vertices)), key=lambda i: (vertices[i][1], vertices[i][0])
+            )
+            return np.roll(vertices, -lowest, axis=0)
+
+        polygon = np.array(c_vertices, dtype=np.float64)
+        p_vertices = from_lowest(polygon)
+        q_vertices = from_lowest(-polygon)
+        p_edges = np.roll(p_vertices, -1, axis=0) - p_vertices
+        q_edges = np.roll(q_vertices, -1, axis=0) - q_vertices
+
+        s_vertices = []
+        i, j = 0, 0
+        while i < len(p_vertices) or j < len(q_vertices):
+            s_vertices.append(
+                (
+                    p_vertices[i % len(p_vertices), 0]
+                    + q_vertices[j % len(q_vertices), 0],
+                    p_vertices[i % len(p_vertices), 1]
+                    + q_vertices[j % len(q_vertices), 1],
+                )
+            )
+            p_edge = p_edges[i % len(p_vertices)]
+            q_edge = q_edges[j % len(q_vertices)]
+            cross = p_edge[0] * q_edge[1] - p_edge[1] * q_edge[0]
+            if i == len(p_vertices):
+                j += 1
+            elif j == len(q_vertices):
+                i += 1
+            else:
+                if cross >= 0:
+                    i += 1
+                if cross <= 0:
+                    j += 1
+
+        s_array = np.array(s_vertices)
+        perimeter = np.sqrt(
+            ((np.roll(s_array, -1, axis=0) - s_array) ** 2).sum(axis=1)
+        ).sum()
+        return s_vertices, perimeter
+
+    @staticmethod
+    def get_isotropic_scale(s_vertices):
+        """
+        Computes the isotropic scaling factor of the sensitivity hull.
+
+        The factor is the inverse root of the second moment E[x ** 2 + y ** 2] of a point
+        drawn uniformly from the polygon, computed exactly with the polygon moment formulas.
+
+        Args:
+            s_vertices (list): The sensitivity hull vertices in counterclockwise order.
+
+        Returns:
+            float: The scaling factor t, i.e., E[x ** 2 + y ** 2] ** (-0.5).
+        """
+        x, y = np.array(s_vertices, dtype=np.float64).T
+        next_x, next_y = np.roll(x, -1), np.roll(y, -1)
+        cross = x * next_y - next_x * y
+        area = cross.sum() / 2
+        second_moment = (
+            cross
+            * (
+                x * x
+                + x * next_x
+                + next_x * next_x
+                + y * y
+                + y * next_y
+                + next_y * next_y
+            )
+        ).sum() / 12
+        return (second_moment / area) ** (-0.5)
+
+    @staticmethod
+    def release_point(
+        prior_ids,
+        prior_probs,
+        true_cell,
+        prev_cell,
+        epsilon,
+        delta_dp,
+        kernel_tolerance=None,
+        hull_cache=None,
+        rng=random,
+    ):
+        """
+        Releases one perturbed cell with PIM and updates the posterior.
+
+        Args:
+            prior_ids (np.ndarray): The cell ids of the prior's support.
+            prior_probs (np.ndarray): The prior probabilities of the support cells.
+            true_cell (tuple): The true cell as a tuple (x, y).
+            prev_cell (tuple): The previously released cell as a tuple (x, y).
+            epsilon (float): The privacy parameter.
+            delta_dp (float): The delta parameter for differential privacy.
+            kernel_tolerance (float, optional): Truncation tolerance of the posterior kernel. Defaults to None (exact).
+            hull_cache (dict, optional): Hulls of the previous step, reused while the location set is unchanged. Defaults to None.
+            rng (RandomStream, optional): The random stream to draw the noise from. Defaults to the global numpy stream.
+
+        Returns:
+            tuple: The released cell (x, y), the posterior mass and the posterior L1 error bound.
+        """
+        x_cell, y_cell = true_cell
+        prev_x, prev_y = prev_cell
+
+        location_set = PrivacyMetric.get_location_set(prior_ids, prior_probs, delta_dp)
+
+        if hull_cache is not None and np.array_equal(
+            hull_cache.get("location_set"), location_set
+        ):
+            c_vertices = hull_cache["c_vertices"]
+            c_polygon = hull_cache["c_polygon"]
+            s_vertices = hull_cache["s_vertices"]
+            s_area = hull_cache["s_area"]
+            t_value = hull_cache["t_value"]
+            triangulation = hull_cache["triangulation"]
+        else:
+            location_cells = np.stack(
+                np.divmod(location_set, Configuration.GRID_SIZE), axis=1
+            )
+            corner_offsets = np.array(
+                [(-0.5, -0.5), (-0.5, 0.5), (0.5, -0.5), (0.5, 0.5)]
+            )
+            points = (location_cells[:, None, :] + corner_offsets).reshape(-1, 2)
+
+            cacheable = True
+            try:
+                c_hull = ConvexHull(points)
+            except Exception as err:
+                cacheable = False
+                points = [
+                    (x, y)
+                    for x, y in [
+                        (
+                            prev_x - Configuration.GRID_SIZE,
+                            prev_y - Configuration.GRID_SIZE,
+                        ),
+                        (
+                            prev_x - Configuration.GRID_SIZE,
+                            prev_y + Configuration.GRID_SIZE,
+                        ),
+                        (
+                            prev_x + Configuration.GRID_SIZE,
+                            prev_y - Configuration.GRID_SIZE,
+                        ),
+                        (
+                            prev_x + Configuration.GRID_SIZE,
+                            prev_y + Configuration.GRID_SIZE,
+                        ),
+                    ]
+                    if Coordinates.in_range_cell((x, y))
+                ]
+                points = np.array([(x, y) for x, y in points])
+                c_hull = ConvexHull(points)
+
+            c_vertices = [
+                (points[vertex, 0], points[vertex, 1]) for vertex in c_hull.vertices
+            ]
+            c_polygon = Polygon(c_vertices)
+
+            s_vertices, s_area = PrivacyMetric.get_sensitivity_hull(c_vertices)
+            t_value = PrivacyMetric.get_isotropic_scale(s_vertices)
+            triangulation = Sampling.triangulate_polygon(s_vertices)
+
+            if hull_cache is not None and cacheable:
+                hull_cache["location_set"] = location_set
+                hull_cache["c_vertices"] = c_vertices
+                hull_cache["c_polygon"] = c_polygon
+                hull_cache["s_vertices"] = s_vertices
+                hull_cache["s_area"] = s_area
+                hull_cache["t_value"] = t_value
+                hull_cache["triangulation"] = triangulation
+
+        if not c_polygon.contains(Point(x_cell, y_cell)):
+            x_cell, y_cell = Sampling.sample_closest((x_cell, y_cell), c_vertices)
+
+        # sampling the sensitivity hull directly equals sampling the normalized hull / t_value
+        while True:
+            sampled_points = Sampling.sample_uniformly_batch(
+                s_vertices, PrivacyMetric.NOISE_BLOCK_SIZE, triangulation, rng
+            )
+            noise_r = rng.gamma(3, epsilon ** (-1), PrivacyMetric.NOISE_BLOCK_SIZE)
+            final_points = (
+                np.array([x_cell, y_cell]) + sampled_points * noise_r[:, None]
+            )
+            in_range = (
+                (0 <= final_points) & (final_points < Configuration.GRID_SIZE)
+            ).all(axis=1)
+            if in_range.any():
+                final_x, final_y = final_points[np.argmax(in_range)]
+                break
+        final_x, final_y = int(final_x), int(final_y)
+
+        # update posterior prob on the prior's support
+        posterior_ids, posterior_probs, error_bound = PrivacyMetric.update_posterior(
+            prior_ids,
+            prior_probs,
+            (final_x, final_y),
+            epsilon,
+            t_value,
+            s_area,
+            kernel_tolerance,
+        )
+        return (final_x, final_y), posterior_probs.sum(), error_bound
+
+    @staticmethod
+    def apply_pim(
+        trajectory,
+        epsilon,
+        delta_dp,
+        correlation,
+        length=100,
+        kernel_tolerance=None,
+        rng=random,
+    ):
+        """
+        Apply the PIM algorithm to a single trajectory.
+
+        Args:
+            trajectory (list): The cell trajectory as a list of tuples (x, y, t).
             epsilon (float): The privacy parameter.
             delta_dp (float): The delta parameter for differential privacy.
             correlation (Correlation): The correlation model for transition probabilities.
-            copies (int, optional): The number of copies to generate. Defaults to 5.
+            length (int, optional): The maximum number of released points. Defaults to 100.
+            kernel_tolerance (float, optional): Truncation tolerance of the posterior kernel, see update_posterior. Defaults to None (exact).
+            rng (RandomStream, optional): The random stream to draw the noise from. Defaults to the global numpy stream.
 
         Returns:
-            None
+            list: The differentially private trajectory as a list of tuples (x, y, t).
         """
+        return PrivacyMetric.apply_pim_with_bound(
+            trajectory, epsilon, delta_dp, correlation, length, kernel_tolerance, rng
+        )[0]
+
+    @staticmethod
+    def apply_pim_with_bound(
+        trajectory,
+        epsilon,
+        delta_dp,
+        correlation,
+        length=100,
+        kernel_tolerance=None,
+        rng=random,
+    ):
+        """
+        Apply the PIM algorithm to a single trajectory and report the truncation error.
+
+        The prior and posterior are kept on their non-zero support, so the cost of a step
+        scales with the support size rather than with GRID_SIZE ** 2.
+        The transition matrix comes from Correlation.to_sparse, which converts a dict-backed
+        model once and then serves the cached SparseCorrelation.
 
-        def apply_pim(trajectory, epsilon, delta_dp, correlation, length=100):
-            prev_x, prev_y, prev_t = (
-                int(trajectory[0][0]),
-                int(trajectory[0][1]),
-                trajectory[0][2],
+        Args:
+            trajectory (list): The cell trajectory as a list of tuples (x, y, t).
+            epsilon (float): The privacy parameter.
+            delta_dp (float): The delta parameter for differential privacy.
+            correlation (Correlation): The correlation model for transition probabilities.
+            length (int, optional): The maximum number of released points. Defaults to 100.
+            kernel_tolerance (float, optional): Truncation tolerance of the posterior kernel, see update_posterior. Defaults to None (exact).
+            rng (RandomStream, optional): The random stream to draw the noise from. Defaults to the global numpy stream.
+
+        Returns:
+            tuple: The differentially private trajectory as a list of tuples (x, y, t) and the
+                largest per-step L1 error bound of the posterior (0.0 when exact).
+        """
+        prev_x, prev_y, prev_t = (
+            int(trajectory[0][0]),
+            int(trajectory[0][1]),
+            trajectory[0][2],
+        )
+
+        transition_matrix = correlation.to_sparse().get_transition_matrix()
+        prior_ids, prior_probs = PrivacyMetric.propagate_prior(
+            np.array([Coordinates.get_cell_id((prev_x, prev_y))]),
+            np.ones(1),
+            transition_matrix,
+        )
+
+        result = [(prev_x, prev_y, prev_t)]
+        max_error_bound = 0.0
+        hull_cache = {}
+        for x_cell, y_cell, timestamp in trajectory[1:length]:
+            (final_x, final_y), posterior_mass, error_bound = (
+                PrivacyMetric.release_point(
+                    prior_ids,
+                    prior_probs,
+                    (x_cell, y_cell),
+                    (prev_x, prev_y),
+                    epsilon,
+                    delta_dp,
+                    kernel_tolerance,
+                    hull_cache,
+                    rng,
+                )
             )
+            max_error_bound = max(max_error_bound, error_bound)
 
-            posterior = np.zeros((Configuration.GRID_SIZE, Configuration.GRID_SIZE))
-            posterior[prev_x][prev_y] = 1
-
-            prior = np.zeros((Configuration.GRID_SIZE, Configuration.GRID_SIZE))
-            for x in range(Configuration.GRID_SIZE):
-                for y in range(Configuration.GRID_SIZE):
-                    for (tran_x, tran_y), tran_prob in correlation.get_transition(
-                        (x, y)
-                    ).items():
-                        prior[tran_x, tran_y] += posterior[x, y] * tran_prob
-
-            result = [(prev_x, prev_y, prev_t)]
-            for x_cell, y_cell, timestamp in trajectory[1:length]:
-                true_x, true_y = x_cell, y_cell
-
-                sorted_prior = []
-                for x in range(Configuration.GRID_SIZE):
-                    for y in range(Configuration.GRID_SIZE):
-                        sorted_prior.append((-prior[x, y], x, y))
-                heapq.heapify(sorted_prior)
-
-                location_set = []
-                set_sum = 0
-                while True:
-                    pr, x, y = heapq.heappop(sorted_prior)
-                    if set_sum >= 1 - delta_dp:
-                        break
-                    location_set.append((x, y, -pr))
-                    set_sum += -pr
-
-                points = []
-                for x, y, _ in location_set:
-                    points += Coordinates.get_cell_corners((x, y))
-                points = np.array(points)
+            # the whole posterior mass transits from the released cell
+            prior_ids, prior_probs = PrivacyMetric.propagate_prior(
+                np.array([Coordinates.get_cell_id((final_x, final_y))]),
+                np.array([posterior_mass]),
+                transition_matrix,
+            )
 
-                try:
-                    c_hull = ConvexHull(points)
-                except Exception as err:
-                    points = [
-                        (x, y)
-                        for x, y in [
-                            (
-                                prev_x - Configuration.GRID_SIZE,
-                                prev_y - Configuration.GRID_SIZE,
-                            ),
-                            (
-                                prev_x - Configuration.GRID_SIZE,
-                                prev_y + Configuration.GRID_SIZE,
-                            ),
-                            (
-                                prev_x + Configuration.GRID_SIZE,
-                                prev_y - Configuration.GRID_SIZE,
-                            ),
-                            (
-                                prev_x + Configuration.GRID_SIZE,
-                                prev_y + Configuration.GRID_SIZE,
-                            ),
-                        ]
-                        if Coordinates.in_range_cell((x, y))
-                    ]
-                    points = np.array([(x, y) for x, y in points])
-                    c_hull = ConvexHull(points)
+            result.append((final_x, final_y, timestamp))
+            prev_x, prev_y = final_x, final_y
 
-                c_vertices = [
-                    (points[vertex, 0], points[vertex, 1]) for vertex in c_hull.vertices
-                ]
+        return result, max_error_bound
 
-                if not Polygon(c_vertices).contains(Point(x_cell, y_cell)):
-                    x_cell, y_cell = Sampling.sample_closest(
-                        (x_cell, y_cell), c_vertices
-                    )
+    @staticmethod
+    def init_worker(correlation, grid_size):
+        """
+        Initializes a PIM worker process with the shared correlation model.
 
-                vertex_set = {}
-                for x in c_vertices:
-                    for y in c_vertices:
-                        if x == y:
-                            continue
-                        vertex_set[(x[0] - y[0], x[1] - y[1])] = 1
-                s_points = np.array(list(vertex_set.keys()))
+        Args:
+            correlation (SparseCorrelation): The correlation model, received once per worker.
+            grid_size (int): The grid size of the parent process.
+        """
+        Configuration.GRID_SIZE = grid_size
+        PrivacyMetric.worker_correlation = correlation
 
-                s_hull = ConvexHull(s_points)
+    @staticmethod
+    def run_pim_job(trajectories, epsilon, delta_dp, kernel_tolerance, rng):
+        """
+        Runs PIM on a chunk of trajectories with the worker's correlation model.
 
-                s_vertices = [
-                    (s_points[vertex, 0], s_points[vertex, 1])
-                    for vertex in s_hull.vertices
-                ]
-                p = Polygon(s_vertices)
-
-                t_value = None
-                l = 1
-                while True:
-                    sampled_points = [Sampling.sample_uniformly(p) for _ in range(l)]
-
-                    def get_new_t(points):
-                        t_sum = 0
-                        for x, y in points:
-                            t_sum += x * x + y * y
-                        return (t_sum / l) ** (-0.5)
-
-                    new_t = get_new_t(sampled_points)
-                    if t_value == None or abs(new_t - t_value) > 1e-3:
-                        t_value = new_t
-                        l += 1
-                    else:
-                        break
-
-                normalized_vertices = [
-                    (x * t_value, y * t_value) for x, y in s_vertices
-                ]
+        Args:
+            trajectories (list): The cell trajectories of the chunk.
+            epsilon (float): The privacy parameter.
+            delta_dp (float): The delta parameter for differential privacy.
+            kernel_tolerance (float): Truncation tolerance of the posterior kernel, or None.
+            rng (RandomStream): The random stream of the job.
 
-                while True:
-                    sampled_point = Sampling.sample_uniformly(
-                        Polygon(normalized_vertices)
-                    )
-                    noise_r = random.gamma(3, epsilon ** (-1))
-                    final_x, final_y = (
-                        x_cell + sampled_point[0] / t_value * noise_r,
-                        y_cell + sampled_point[1] / t_value * noise_r,
-                    )
-                    if Coordinates.in_range_cell((final_x, final_y)):
-                        break
-                final_x, final_y = int(final_x), int(final_y)
-
-                # update posterior prob
-                posterior = np.zeros((Configuration.GRID_SIZE, Configuration.GRID_SIZE))
-                prob_from = np.ones((Configuration.GRID_SIZE, Configuration.GRID_SIZE))
-                prob_from *= epsilon**2 / 2 / s_hull.area
-                sum_prob = 0
-                for x in range(Configuration.GRID_SIZE):
-                    for y in range(Configuration.GRID_SIZE):
-                        prob_from[x, y] *= math.e ** (
-                            -epsilon
-                            * t_value
-                            * math.sqrt((final_x - x) ** 2 + (final_y - y) ** 2)
-                        )
-                        sum_prob += prior[x, y] * prob_from[x, y]
+        Returns:
+            list: The (trajectory, error_bound) outputs of apply_pim_with_bound for each trajectory of the chunk.
+        """
+        correlation = PrivacyMetric.worker_correlation
+        return [
+            PrivacyMetric.apply_pim_with_bound(
+                trajectory,
+                epsilon,
+                delta_dp,
+                correlation,
+                kernel_tolerance=kernel_tolerance,
+                rng=rng,
+            )
+            for trajectory in trajectories
+        ]
 
-                if sum_prob <= 0:
-                    posterior[final_x][final_y] = 1
-                else:
-                    for x in range(Configuration.GRID_SIZE):
-                        for y in range(Configuration.GRID_SIZE):
-                            posterior[x][y] = prior[x, y] * prob_from[x, y] / sum_prob
+    @staticmethod
+    def read_pim_shard(shard_path):
+        """
+        Reads the finished trajectories of a PIM shard file.
 
-                prior = np.zeros((Configuration.GRID_SIZE, Configuration.GRID_SIZE))
-                dp_distribution = correlation.get_transition((final_x, final_y))
+        Lines that cannot be parsed, e.g. a record cut short by a crash, are skipped.
 
-                for x in range(Configuration.GRID_SIZE):
-                    for y in range(Configuration.GRID_SIZE):
-                        for (tran_x, tran_y), tran_prob in dp_distribution.items():
-                            prior[tran_x, tran_y] += posterior[x, y] * tran_prob
+        Args:
+            shard_path (str): The JSON Lines shard file of one copy.
+
+        Returns:
+            dict: The records keyed by trajectory index.
+        """
+        records = {}
+        if not Path(shard_path).exists():
+            return records
+        with open(shard_path, "r") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                records[record["index"]] = record
+        return records
 
-                result.append((final_x, final_y, timestamp))
-                prev_x, prev_y = final_x, final_y
+    @staticmethod
+    def pim(
+        data,
+        dataset,
+        epsilon,
+        delta_dp,
+        correlation,
+        copies=1,
+        kernel_tolerance=None,
+        batch_size=None,
+        n_jobs=None,
+        resume=False,
+        seed=None,
+    ):
+        """
+        Apply the PIM algorithm to generate differentially private copies of the input data.
 
-            return result
+        All (copy, trajectory) pairs are scheduled as one job grid on a single process pool,
+        longest trajectories first. Each worker receives the correlation model once.
+        Finished trajectories are appended to a per-copy JSON Lines shard as they complete,
+        and each shard is compacted into the .dat file expected by DataLoader.load_dp_data
+        once its copy is complete.
 
+        Args:
+            data (list): The input trajectory data.
+            dataset (Dataset): The dataset being used.
+            epsilon (float): The privacy parameter.
+            delta_dp (float): The delta parameter for differential privacy.
+            correlation (Correlation): The correlation model for transition probabilities.
+            copies (int, optional): The number of copies to generate. Defaults to 5.
+            kernel_tolerance (float, optional): Truncation tolerance of the posterior kernel. Defaults to None (exact).
+            batch_size (int, optional): Number of trajectories per job, to amortize the job overhead. Defaults to None (one per job).
+            n_jobs (int, optional): Number of worker processes. Defaults to None (all CPUs).
+            resume (bool, optional): Skip trajectories already written by an interrupted run. Defaults to False.
+            seed (int, optional): The seed of the job streams; each job draws its noise from its own spawned stream. Defaults to None (drawn from the global numpy stream).
+
+        Returns:
+            None
+        """
         print("Generating dp copies using pim...")
+        correlation = correlation.to_sparse()
         out_path = Configuration.DP_DATA_PATH.format(dataset.value, "pim")
         Path(out_path).mkdir(parents=True, exist_ok=True)
 
-        for index in tqdm(range(copies)):
-            dp_trajectories = Parallel(n_jobs=16, verbose=1)(
-                delayed(apply_pim)(t, epsilon, delta_dp, correlation) for t in data
+        out_files = [
+            PurePath(out_path, "{}_{:.3f}_{}.dat".format(dataset.value, epsilon, index))
+            for index in range(copies)
+        ]
+        shard_paths = [
+            PurePath(
+                out_path, "{}_{:.3f}_{}.jsonl".format(dataset.value, epsilon, index)
             )
-            with open(
-                PurePath(
-                    Configuration.DP_DATA_PATH.format(dataset.value, "pim"),
-                    "{}_{:.3f}_{}.dat".format(dataset.value, epsilon, index),
-                ),
-                "w",
-            ) as f:
-                json.dump(dp_trajectories, f)
+            for index in range(copies)
+        ]
+
+        # copies compacted by an earlier run are left untouched
+        pending = [
+            not resume
+            or not Path(out_files[index]).exists()
+            or Path(shard_paths[index]).exists()
+            for index in range(copies)
+        ]
+        finished = [set() for _ in range(copies)]
+        for index in range(copies):
+            if not resume:
+                Path(shard_paths[index]).unlink(missing_ok=True)
+            elif not pending[index]:
+                finished[index] = set(range(len(data)))
+            else:
+                # rewrite the valid records so that new ones never follow a torn line
+                records = PrivacyMetric.read_pim_shard(shard_paths[index])
+                with open(shard_paths[index], "w") as f:
+                    for record in records.values():
+                        f.write(json.dumps(record) + "\n")
+                finished[index] = set(records)
+                if finished[index]:
+                    print(
+                        "Resuming copy {} with {} trajectories done.".format(
+                            index, len(finished[index])
+                        )
+                    )
+
+        jobs = sorted(
+            (
+                (index, trajectory_index)
+                for index in range(copies)
+                for trajectory_index in range(len(data))
+                if trajectory_index not in finished[index]
+            ),
+            key=lambda job: -len(data[job[1]]),
+        )
+        chunk_size = batch_size or 1
+        chunks = [jobs[i : i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+        job_streams = RandomStream(seed).spawn(len(chunks))
+
+        shard_files = [
+            open(shard_path, "a") if pending[index] else None
+            for index, shard_path in enumerate(shard_paths)
+        ]
+        failures = []
+        try:
+            with ProcessPoolExecutor(
+                max_workers=n_jobs or os.cpu_count(),
+                initializer=PrivacyMetric.init_worker,
+                initargs=(correlation, Configuration.GRID_SIZE),
+            ) as executor:
+                futures = {
+                    executor.submit(
+                        PrivacyMetric.run_pim_job,
+                        [data[trajectory_index] for _, trajectory_index in chunk],
+                        epsilon,
+                        delta_dp,
+                        kernel_tolerance,
+                        job_stream,
+                    ): chunk
+                    for chunk, job_stream in zip(chunks, job_streams)
+                }
+                for future in tqdm(as_completed(futures), total=len(futures)):
+                    # a failed job must not discard the results of the others
+                    try:
+                        outputs = future.result()
+                    except Exception as err:
+                        failures.append(err)
+                        continue
+                    for (index, trajectory_index), output in zip(
+                        futures[future], outputs
+                    ):
+                        trajectory, error_bound = output
+                        record = {
+                            "index": trajectory_index,
+                            "trajectory": trajectory,
+                            "error_bound": error_bound,
+                        }
+                        shard_files[index].write(json.dumps(record) + "\n")
+                        shard_files[index].flush()
+        finally:
+            for shard_file in shard_files:
+                if shard_file is not None:
+                    shard_file.close()
+
+        if failures:
+            raise RuntimeError(
+                "PIM failed for {} of {} jobs; the finished trajectories are kept in the "
+                "shards, rerun with resume=True to complete them.".format(
+                    len(failures), len(chunks)
+                )
+            ) from failures[0]
+
+        for index in range(copies):
+            if not pending[index]:
+                continue
+            records = PrivacyMetric.read_pim_shard(shard_paths[index])
+            if kernel_tolerance is not None:
+                print(
+                    "Posterior truncation error bound (L1): {:.3e}".format(
+                        max(
+                            (
+                                record.get("error_bound", 0.0)
+                                for record in records.values()
+                            ),
+                            default=0.0,
+                        )
+                    )
+                )
+            with open(str(out_files[index]) + ".tmp", "w") as f:
+                json.dump(
+                    [records[i]["trajectory"] for i in range(len(data))],
+                    f,
+                )
+            os.replace(str(out_files[index]) + ".tmp", out_files[index])
+            Path(shard_paths[index]).unlink()
 
         print("Generation OK.")
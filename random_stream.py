@@ -0,0 +1,129 @@
+from imports import *
+
+
+class RandomStream:
+    """
+    A reproducible random stream that draws uniform numbers in buffered blocks.
+
+    It exposes the part of the numpy.random API used in this project, so it can be passed
+    wherever the global numpy stream is used. Child streams are spawned from the SeedSequence,
+    so every worker, trial and party can own an independent stream.
+    """
+
+    def __init__(self, seed=None, block_size=4096):
+        """
+        Initializes the stream.
+
+        Args:
+            seed (int or SeedSequence, optional): The seed of the stream. Defaults to None (drawn from the global numpy stream, so np.random.seed applies).
+            block_size (int, optional): The number of uniform numbers drawn per block. Defaults to 4096.
+        """
+        if isinstance(seed, np.random.SeedSequence):
+            self.seed_sequence = seed
+        else:
+            if seed is None:
+                seed = random.randint(0, 2**32, size=4, dtype=np.uint64).tolist()
+            self.seed_sequence = np.random.SeedSequence(seed)
+        self.generator = np.random.default_rng(self.seed_sequence)
+        self.block_size = block_size
+        self.buffer = []
+        self.position = 0
+
+    def spawn(self, n):
+        """
+        Spawns independent child streams.
+
+        Args:
+            n (int): The number of child streams.
+
+        Returns:
+            list: The child streams.
+        """
+        return [
+            RandomStream(child, self.block_size)
+            for child in self.seed_sequence.spawn(n)
+        ]
+
+    def random(self, size=None):
+        """
+        Draws uniform numbers in [0, 1).
+
+        Single draws are served from the buffered block; sized draws go to the generator.
+
+        Args:
+            size (int or tuple, optional): The output shape. Defaults to None (one float).
+
+        Returns:
+            float or np.ndarray: The uniform numbers.
+        """
+        if size is not None:
+            return self.generator.random(size)
+        if self.position >= len(self.buffer):
+            self.buffer = self.generator.random(self.block_size).tolist()
+            self.position = 0
+        value = self.buffer[self.position]
+        self.position += 1
+        return value
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        """
+        Draws uniform numbers in [low, high).
+
+        Args:
+            low (float, optional): The lower bound. Defaults to 0.0.
+            high (float, optional): The upper bound. Defaults to 1.0.
+            size (int or tuple, optional): The output shape. Defaults to None (one float).
+
+        Returns:
+            float or np.ndarray: The uniform numbers.
+        """
+        if size is not None:
+            return self.generator.uniform(low, high, size)
+        return low + (high - low) * self.random()
+
+    def randint(self, low, high=None, size=None):
+        """
+        Draws integers in [low, high), or in [0, low) without high.
+
+        Args:
+            low (int): The lower bound, or the upper bound without high.
+            high (int, optional): The upper bound. Defaults to None.
+            size (int or tuple, optional): The output shape. Defaults to None (one int).
+
+        Returns:
+            int or np.ndarray: The integers.
+        """
+        if high is None:
+            low, high = 0, low
+        if size is not None:
+            return self.generator.integers(low, high, size)
+        return min(low + int(self.random() * (high - low)), high - 1)
+
+    def choice(self, a, size=None, replace=True, p=None):
+        """
+        Draws elements of a, as numpy.random.choice.
+
+        Args:
+            a (int or array-like): The elements, or their count.
+            size (int or tuple, optional): The output shape. Defaults to None (one element).
+            replace (bool, optional): Draw with replacement. Defaults to True.
+            p (array-like, optional): The probability of each element. Defaults to None (uniform).
+
+        Returns:
+            object or np.ndarray: The drawn elements.
+        """
+        return self.generator.choice(a, size, replace, p)
+
+    def gamma(self, shape, scale=1.0, size=None):
+        """
+        Draws from a gamma distribution.
+
+        Args:
+            shape (float): The shape of the distribution.
+            scale (float, optional): The scale of the distribution. Defaults to 1.0.
+            size (int or tuple, optional): The output shape. Defaults to None (one float).
+
+        Returns:
+            float or np.ndarray: The gamma variates.
+        """
+        return self.generator.gamma(shape, scale, size)
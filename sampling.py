@@ -2,6 +2,8 @@ from imports import *
 from configuration import *
 from distance import *
 from coordinates import *
+from random_stream import *
+from correlation import *
 
 
 class Sampling:
@@ -10,9 +12,9 @@ class Sampling:
     """
 
     @staticmethod
-    def sample_proportionally_with_truth(candidates, truth, p):
+    def sample_proportionally_with_truth(candidates, truth, p, rng=random):
         if sum(candidates.values()) <= 0:
-            sampled_cell = list(candidates.keys())[random.randint(len(candidates))]
+            sampled_cell = list(candidates.keys())[rng.randint(len(candidates))]
         else:
             if truth:
                 total = sum(candidates.values()) - candidates[truth]
@@ -27,7 +29,7 @@ class Sampling:
                 total = sum(candidates.values())
                 candidates = {key: value / total for key, value in candidates.items()}
             sampled_cell = list(candidates.keys())[
-                random.choice(
+                rng.choice(
                     range(len(candidates)),
                     p=[candidates[key] for key in candidates.keys()],
                 )
@@ -73,52 +75,262 @@ class Sampling:
                 )
         return sampled_cell, fp_state
 
+    @staticmethod
+    def get_emission_candidates(correlation, cell):
+        """
+        Retrieves the emission candidates of a cell as arrays with the cell as truth.
+
+        The arrays are kept in the candidate cache of the model, so they are bounded and
+        dropped together with the model. A cell missing from its own emission row is
+        appended with zero weight.
+
+        Args:
+            correlation (Correlation): The correlation model for emission probabilities.
+            cell (tuple): The true cell.
+
+        Returns:
+            tuple: The read-only candidate cells (k x 2), their weights (k,) and the index of the truth.
+        """
+        cell = tuple(cell)
+
+        def build():
+            emission = correlation.get_emission(cell)
+            cells = np.array(list(emission.keys()), dtype=np.int64).reshape(-1, 2)
+            weights = np.array(list(emission.values()), dtype=np.float64)
+            matches = np.flatnonzero((cells == cell).all(axis=1))
+            if len(matches):
+                truth = int(matches[0])
+            else:
+                cells = np.vstack((cells, [cell]))
+                weights = np.append(weights, 0.0)
+                truth = len(cells) - 1
+            cells.flags.writeable = False
+            weights.flags.writeable = False
+            return cells, weights, truth
+
+        return candidate_cache.get(correlation, ("emission", cell), build)
+
+    @staticmethod
+    def sample_emission(correlation, cell, p, draws):
+        """
+        Samples from the emission probabilities of a cell, keeping the cell with probability 1 - p.
+
+        Args:
+            correlation (Correlation): The correlation model for emission probabilities.
+            cell (tuple): The true cell.
+            p (float or np.ndarray): The fingerprinting probability, shared or one per draw.
+            draws (np.ndarray): One uniform draw in [0, 1) per sample.
+
+        Returns:
+            tuple: The sampled cells (n x 2) and the fingerprint states (n,).
+        """
+        cells, weights, truth = Sampling.get_emission_candidates(correlation, cell)
+        draws = np.asarray(draws, dtype=np.float64).reshape(-1)
+        n, width = len(draws), len(weights)
+        picks = Sampling.draw_with_truth(
+            np.broadcast_to(weights, (n, width)),
+            np.ones((n, width), dtype=bool),
+            np.full(n, truth),
+            np.broadcast_to(np.asarray(p, dtype=np.float64), (n,)),
+            draws,
+        )
+        return cells[picks], (picks != truth).astype(np.int64)
+
     @staticmethod
     def sample_candidates(
-        prev_cell, true_cell, p, tau, correlation=None, replace=True, debug=False
+        prev_cell,
+        true_cell,
+        p,
+        tau,
+        correlation=None,
+        replace=True,
+        debug=False,
+        rng=random,
     ):
-        (
-            candidates,
-            tau_candidates,
-            tau_dist_candidates,
-        ) = correlation.get_all_transition(
-            prev_cell, true_cell, tau, consider_distance=True
+        sampled_cells, fp_states = Sampling.sample_candidates_batch(
+            [prev_cell], [true_cell], p, tau, correlation, replace, rng
         )
+        return tuple(sampled_cells[0].tolist()), int(fp_states[0])
 
-        fp_state = 0
+    @staticmethod
+    def get_padded_candidates(prev_cells, tau, correlation, tier=1):
+        """
+        Gathers one candidate tier of many previous cells into padded arrays.
 
-        if true_cell in tau_dist_candidates.keys():
-            if len(tau_dist_candidates) > 1:
-                sampled_cell, fp_state = Sampling.sample_proportionally_with_truth(
-                    tau_dist_candidates, true_cell, p
-                )
-            elif len(tau_candidates) > 1:
-                sampled_cell, fp_state = Sampling.sample_proportionally_with_truth(
-                    tau_candidates, true_cell, p
-                )
-            else:
-                sampled_cell, fp_state = true_cell, 0
-        else:
-            if len(tau_candidates) > 1:
-                if replace:
-                    temp_true_cell = Sampling.sample_closest(true_cell, tau_candidates)
-                    if Distance.sq_euclidean(
-                        temp_true_cell, true_cell
-                    ) < Distance.sq_euclidean(prev_cell, true_cell):
-                        sampled_cell, _ = Sampling.sample_proportionally_with_truth(
-                            tau_candidates, temp_true_cell, p
-                        )
-                        fp_state = 1
-                    else:
-                        sampled_cell, fp_state = true_cell, 0
-                else:
-                    sampled_cell, _ = Sampling.sample_proportionally_with_truth(
-                        tau_candidates, None, None
-                    )
-                    fp_state = 1
-            else:
-                sampled_cell, fp_state = true_cell, 0
-        return sampled_cell, fp_state
+        Each distinct previous cell is looked up once.
+
+        Args:
+            prev_cells (np.ndarray): The previous cells (n x 2).
+            tau (float): The transition threshold for sampling candidates.
+            correlation (Correlation): The correlation model for transition probabilities.
+            tier (int, optional): 0 for all candidates, 1 for the tau candidates. Defaults to 1.
+
+        Returns:
+            tuple: The candidate cells (n x k x 2), their probabilities (n x k) and the mask of
+                the filled entries (n x k).
+        """
+        prev_cells = np.asarray(prev_cells, dtype=np.int64).reshape(-1, 2)
+        if len(prev_cells) == 1:
+            row_cells, row_probs = correlation.get_candidate_arrays(
+                tuple(prev_cells[0].tolist()), None, tau
+            )[tier]
+            if len(row_probs):
+                valid = np.ones((1, len(row_probs)), dtype=bool)
+                return row_cells[None], row_probs[None], valid
+
+        _, first, inverse = np.unique(
+            Coordinates.get_cell_keys(prev_cells),
+            return_index=True,
+            return_inverse=True,
+        )
+        rows = [
+            correlation.get_candidate_arrays(tuple(prev_cell), None, tau)[tier]
+            for prev_cell in prev_cells[first].tolist()
+        ]
+        width = max([len(row_probs) for _, row_probs in rows] + [1])
+        cells = np.zeros((len(rows), width, 2), dtype=np.int64)
+        probs = np.zeros((len(rows), width))
+        valid = np.zeros((len(rows), width), dtype=bool)
+        for k, (row_cells, row_probs) in enumerate(rows):
+            cells[k, : len(row_probs)] = row_cells
+            probs[k, : len(row_probs)] = row_probs
+            valid[k, : len(row_probs)] = True
+        inverse = inverse.reshape(-1)
+        return cells[inverse], probs[inverse], valid[inverse]
+
+    @staticmethod
+    def sample_candidates_batch(
+        prev_cells,
+        true_cells,
+        p,
+        tau,
+        correlation,
+        replace=True,
+        rng=random,
+        draws=None,
+    ):
+        """
+        Vectorized sample_candidates for a batch of (prev, true) pairs.
+
+        The tau-filtered transition rows of the distinct previous cells are padded into one
+        array. The truth-in-tier checks, the closest replacement and the weighted draw then
+        run as array operations over the whole batch with one uniform draw per pair.
+
+        Args:
+            prev_cells (np.ndarray): The previous sampled cells (n x 2).
+            true_cells (np.ndarray): The true cells (n x 2).
+            p (float or np.ndarray): The fingerprinting probability, shared or one per pair.
+            tau (float): The transition threshold for sampling candidates.
+            correlation (Correlation): The correlation model for transition probabilities.
+            replace (bool, optional): Replace an unreachable truth by the closest candidate. Defaults to True.
+            rng (RandomStream, optional): The random stream to draw from. Defaults to the global numpy stream.
+            draws (np.ndarray, optional): One uniform draw in [0, 1) per pair. Defaults to None (drawn from rng).
+
+        Returns:
+            tuple: The sampled cells (n x 2) and the fingerprint states (n,).
+        """
+        prev_cells = np.asarray(prev_cells, dtype=np.int64).reshape(-1, 2)
+        true_cells = np.asarray(true_cells, dtype=np.int64).reshape(-1, 2)
+        n = len(prev_cells)
+        p = np.broadcast_to(np.asarray(p, dtype=np.float64), (n,))
+        if draws is None:
+            draws = rng.random(n)
+
+        cells, probs, valid = Sampling.get_padded_candidates(
+            prev_cells, tau, correlation
+        )
+
+        # Tiers and truth checks
+        prev_dist = ((prev_cells - true_cells) ** 2).sum(axis=1)
+        true_dist = ((cells - true_cells[:, None]) ** 2).sum(axis=2)
+        dist_valid = valid & (true_dist <= prev_dist[:, None])
+        is_truth = valid & (true_dist == 0)
+        tau_count, dist_count = valid.sum(axis=1), dist_valid.sum(axis=1)
+        truth_in_dist = (is_truth & dist_valid).any(axis=1)
+
+        # Closest replacement of a truth outside the distance tier
+        closest = np.argmin(np.where(valid, true_dist, np.iinfo(np.int64).max), axis=1)
+        rows = np.arange(n)
+        closer = true_dist[rows, closest] < prev_dist
+
+        use_dist = truth_in_dist & (dist_count > 1)
+        use_tau_truth = truth_in_dist & ~use_dist & (tau_count > 1)
+        use_tau_other = ~truth_in_dist & (tau_count > 1) & (closer | (not replace))
+        sampled_rows = use_dist | use_tau_truth | use_tau_other
+
+        support = np.where(use_dist[:, None], dist_valid, valid)
+        truth = np.where(
+            truth_in_dist,
+            np.argmax(is_truth, axis=1),
+            np.where(replace, closest, -1),
+        )
+        picks = Sampling.draw_with_truth(probs, support, truth, p, draws)
+
+        sampled = np.where(
+            sampled_rows[:, None],
+            cells[rows, picks],
+            true_cells,
+        )
+        fp_states = np.where(
+            use_tau_other,
+            1,
+            np.where(sampled_rows & (picks != truth), 1, 0),
+        )
+        return sampled, fp_states.astype(np.int64)
+
+    @staticmethod
+    def draw_with_truth(weights, support, truth, p, draws):
+        """
+        Row-wise weighted draw with the truth reweighting of sample_proportionally_with_truth.
+
+        This is the single weighted draw behind the batch samplers. A row with a truth keeps
+        it with probability 1 - p and shares p among the other supported cells in proportion
+        to their weights; a row without one draws in proportion to the weights. Rows with no
+        supported weight draw uniformly over the support. Zero-weight cells are never picked
+        from a row with positive weight.
+
+        Args:
+            weights (np.ndarray): The candidate weights (n x k).
+            support (np.ndarray): The mask of the candidates of each row (n x k).
+            truth (np.ndarray): The index of the truth of each row, or -1 (n,).
+            p (np.ndarray): The probability of not reporting the truth of each row (n,).
+            draws (np.ndarray): One uniform draw in [0, 1) per row (n,).
+
+        Returns:
+            np.ndarray: The index of the picked candidate of each row (n,).
+        """
+        width = weights.shape[1]
+        truth = np.asarray(truth)
+        p = np.asarray(p, dtype=np.float64)
+        has_truth = truth >= 0
+        truth_mask = has_truth[:, None] & (
+            np.arange(width) == np.maximum(truth, 0)[:, None]
+        )
+
+        weights = np.where(support, weights, 0.0)
+        total = weights.sum(axis=1)
+        others = total - (weights * truth_mask).sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            reweighted = np.where(
+                truth_mask,
+                (1 - p)[:, None],
+                p[:, None] * weights / others[:, None],
+            )
+            normalized = weights / total[:, None]
+        weights = np.where(
+            (total <= 0)[:, None],
+            support.astype(np.float64),
+            np.where(
+                (has_truth & (others != 0))[:, None],
+                reweighted,
+                np.where(has_truth[:, None], truth_mask, normalized),
+            ),
+        )
+
+        # The first cell whose cumulative weight exceeds the draw has positive weight
+        cumulative = np.cumsum(weights, axis=1)
+        picks = (cumulative <= draws[:, None] * cumulative[:, -1:]).sum(axis=1)
+        return np.minimum(picks, width - 1)
 
     @staticmethod
     def sample_uniformly(poly):
@@ -128,6 +340,58 @@ class Sampling:
             if poly.contains(p):
                 return p.x, p.y
 
+    @staticmethod
+    def triangulate_polygon(vertices):
+        """
+        Fan-triangulates a convex polygon for batch sampling.
+
+        Args:
+            vertices (list): The polygon vertices in order.
+
+        Returns:
+            tuple: The triangle anchors (k, 2), the two edge vectors of each triangle (k, 2, 2)
+                and the cumulative area share of the triangles (k,).
+        """
+        vertices = np.asarray(vertices, dtype=np.float64)
+        anchors = np.repeat(vertices[:1], len(vertices) - 2, axis=0)
+        edges = np.stack((vertices[1:-1] - anchors, vertices[2:] - anchors), axis=1)
+        areas = np.abs(
+            edges[:, 0, 0] * edges[:, 1, 1] - edges[:, 0, 1] * edges[:, 1, 0]
+        )
+        if areas.sum() <= 0:
+            areas = np.ones(len(areas))
+        return anchors, edges, np.cumsum(areas) / areas.sum()
+
+    @staticmethod
+    def sample_uniformly_batch(vertices, n, triangulation=None, rng=random):
+        """
+        Samples points uniformly inside a convex polygon without rejection.
+
+        A triangle of the fan triangulation is picked by area and a barycentric draw is
+        mapped into it, so the cost does not depend on the polygon's shape.
+
+        Args:
+            vertices (list): The polygon vertices in order.
+            n (int): The number of points to sample.
+            triangulation (tuple, optional): A precomputed Sampling.triangulate_polygon result.
+            rng (RandomStream, optional): The random stream to draw from. Defaults to the global numpy stream.
+
+        Returns:
+            np.ndarray: The sampled points as an (n, 2) array.
+        """
+        if triangulation is None:
+            triangulation = Sampling.triangulate_polygon(vertices)
+        anchors, edges, cumulative_areas = triangulation
+
+        triangles = np.minimum(
+            np.searchsorted(cumulative_areas, rng.random(n), side="right"),
+            len(cumulative_areas) - 1,
+        )
+        weights = rng.random((n, 2))
+        flipped = weights.sum(axis=1) > 1
+        weights[flipped] = 1 - weights[flipped]
+        return anchors[triangles] + np.einsum("nk,nkd->nd", weights, edges[triangles])
+
     @staticmethod
     def sample_coordinate(cell):
         assert Coordinates.in_range_cell(cell)
@@ -149,28 +413,48 @@ class Sampling:
         return alter_points
 
     @staticmethod
-    def sample_nearby_point(point, scale):
+    def sample_nearby_point(point, scale, rng=random):
         lat, lng = point
         while True:
-            new_lat = int(lat + random.uniform(-scale, scale + 1))
-            new_lng = int(lng + random.uniform(-scale, scale + 1))
+            new_lat = int(lat + rng.uniform(-scale, scale + 1))
+            new_lng = int(lng + rng.uniform(-scale, scale + 1))
             if new_lat != lat or new_lng != lng:
                 break
         return new_lat, new_lng
 
+    @staticmethod
+    def sample_nearby_points(points, scale, rng=random):
+        """
+        Vectorized sample_nearby_point for an array of cells.
+
+        Args:
+            points (np.ndarray): The cells (... x 2).
+            scale (int): The sampling range around each cell.
+            rng (RandomStream, optional): The random stream to draw from. Defaults to the global numpy stream.
+
+        Returns:
+            np.ndarray: A different nearby cell for each input cell.
+        """
+        shape = np.shape(points)
+        points = np.asarray(points).reshape(-1, 2)
+        sampled = points.astype(np.int64)
+        retry = np.ones(len(points), dtype=bool)
+        while retry.any():
+            sampled[retry] = np.trunc(
+                points[retry] + rng.uniform(-scale, scale + 1, (retry.sum(), 2))
+            )
+            retry = (sampled == points).all(axis=1)
+        return sampled.reshape(shape)
+
     @staticmethod
     def sample_portion(candidates, portion):
         count = int(portion * len(candidates))
         return Sampling.sample_count(candidates, count)
 
     @staticmethod
-    def sample_count(candidates, count):
+    def sample_count(candidates, count, rng=random):
         if type(candidates) == int:
-            return random.choice(
-                range(candidates), max(1, count), replace=False
-            ).tolist()
+            return rng.choice(range(candidates), max(1, count), replace=False).tolist()
         else:
-            indexes = random.choice(
-                range(len(candidates)), max(1, count), replace=False
-            )
+            indexes = rng.choice(range(len(candidates)), max(1, count), replace=False)
             return [candidates[index] for index in indexes]